@@ -0,0 +1,341 @@
+#!/usr/bin/python3
+'''Repeatable DDC/CI benchmarks against simulated monitors or real i2c buses.
+
+Reports per Waiter delay setting: Mccs.read() round-trip latency percentiles, settled
+(i.e. read back) writes per second, capability string fetch time and the write-to-confirmed
+latency of the MonitorController task loop with its deadline misses (optionally under
+background reread load). Also the cost of picking the next task with
+hundreds of registers, of parsing a noisy DDC/CI byte stream and the wall time of a
+headless `d2see.py get` answered by the daemon. --json stores the results to compare
+releases.
+'''
+
+import argparse
+import json
+import logging
+import operator
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from functools import partial, reduce
+from types import SimpleNamespace as namespace
+
+import trio
+
+from ddcci import cli, ddcci, xdg
+from ddcci.simulation import SimulatedMonitor
+
+def percentiles(samples):
+    if len(samples) < 2:
+        return dict(p50=None, p90=None, p99=None)
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return dict(p50=cuts[49], p90=cuts[89], p99=cuts[98])
+
+
+def open_edid_device(bus, sim_args):
+    if bus == 'sim':
+        return ddcci.EdidDevice('sim', i2c_dev=SimulatedMonitor(**sim_args).i2c_dev)
+    else:
+        return ddcci.EdidDevice(bus)
+
+
+async def bench_mccs(edid_device, delays, args):
+    open_config = partial(xdg.open_config, f'd2see/{edid_device.edid_id}')
+    mccs = ddcci.Mccs(file_name=edid_device.file_name, open_config=open_config,
+        i2c_dev=edid_device.i2c_dev)
+    ddcci.ctx_monitor.set(edid_device.edid_id)
+    ddcci.ctx_quirks.set(ddcci.new_quirks())
+    res = {}
+    try:
+        with mccs.waiter.safe_delay():
+            orig, mx, _ = await mccs.read(args.register)
+        with mccs.waiter.set_delay(*delays):
+            latencies, failed = [], 0
+            for _ in range(args.rounds):
+                start = time.perf_counter()
+                try:
+                    await mccs.read(args.register)
+                except OSError:
+                    failed += 1
+                else:
+                    latencies.append(time.perf_counter() - start)
+            res['read_latency'] = percentiles(latencies)
+            res['reads_failed'] = failed
+
+            settled = 0
+            start = time.perf_counter()
+            for _ in range(args.rounds):
+                value = random.randint(0, mx)
+                await mccs.write(args.register, value)
+                try:
+                    settled += (await mccs.read(args.register))[0] == value
+                except OSError:
+                    pass
+            res['settled_writes_per_s'] = settled / (time.perf_counter() - start)
+            res['writes_unsettled'] = args.rounds - settled
+
+            fetch_times = []
+            for _ in range(args.capability_rounds):
+                mccs.capabilities = None
+                mccs._capabilities = bytearray()
+                start = time.perf_counter()
+                try:
+                    await mccs.read_capabilities()
+                except OSError:
+                    continue
+                fetch_times.append(time.perf_counter() - start)
+            res['capabilities_s'] = min(fetch_times, default=None)
+        with mccs.waiter.safe_delay():
+            await mccs.write(args.register, orig)
+            # the next Mccs on this bus does not know about our last write
+            await trio.sleep(max(0, mccs.waiter.earliest('w') - time.time()))
+    finally:
+        mccs.close()
+    return res
+
+
+async def background_load(mc, args):
+    while True:
+        setting = mc._settings[random.choice(args.load_registers)]
+        if setting.writings_left == 0:
+            setting.reread()
+            mc._signal_prio_change(setting)
+        await trio.sleep(1 / args.load)
+
+
+async def bench_controller(edid_device, delays, args):
+    mc = ddcci.MonitorController(edid_device, None)
+    waiter = mc._mccs.waiter
+    setting = mc._settings[args.register]
+    latencies = []
+    orig = None
+    try:
+        async with trio.open_nursery() as nursery:
+            nursery.start_soon(mc._run)
+            while setting.max is None:
+                await trio.sleep(.001)
+            orig = setting.current_value
+            if args.load:
+                nursery.start_soon(background_load, mc, args)
+            with waiter.set_delay(*delays):
+                for _ in range(args.rounds):
+                    value = random.choice([v for v in range(setting.max + 1) if v != setting.current_value])
+                    start = time.perf_counter()
+                    mc.write(args.register, value)
+                    while not (setting.confirmed and setting.current_value == value):
+                        await trio.sleep(.001)
+                    latencies.append(time.perf_counter() - start)
+            nursery.cancel_scope.cancel()
+    finally:
+        if orig is not None:
+            with mc._mccs.waiter.safe_delay(), trio.CancelScope(shield=True):
+                await mc._mccs.write(args.register, orig)
+                # the next Mccs on this bus does not know about our last write
+                await trio.sleep(max(0, mc._mccs.waiter.earliest('w') - time.time()))
+        mc.close()
+    return dict(confirmed_write_latency=percentiles(latencies),
+        deadlines={service.name: vars(stats) for service, stats in mc.deadline_stats.items()})
+
+
+def bench_scheduler(size, args):
+    '''Per task: pick it, let it interact and make some other setting want a write.
+    Returns seconds per pick from the task queue and by scanning all priorities.'''
+    registers = [vcp for vcp in range(0x100) if vcp not in (0x02, 0x52)][:size]
+    sim = SimulatedMonitor(registers={vcp: (0, 100) for vcp in registers}, seed=args.seed)
+    mc = ddcci.MonitorController(ddcci.EdidDevice('sim', i2c_dev=sim.i2c_dev), None)
+    settings = [mc._settings[vcp] for vcp in registers]
+    rounds = args.rounds * 10
+    res = {}
+    try:
+        for name, pick in (
+                ('queue', mc._tasks.top),
+                ('scan', lambda: max(mc._settings.values(), key=lambda item: item.priority()))):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                mc._interacted(pick())
+                mc.write(random.choice(settings).register, random.randint(0, 100))
+            res[name] = (time.perf_counter() - start) / rounds
+    finally:
+        mc.close()
+    return res
+
+
+def noisy_stream(size, rng):
+    '''DDC/CI replies (a tenth with a flipped bit), null msgs, runs of padding and
+    garbage (often starting with the source address 0x6e) in random order.'''
+    stream = bytearray()
+    while len(stream) < size:
+        kind = rng.random()
+        if kind < .4:
+            value, mx = rng.randrange(101), 100
+            payload = bytes([0x02, 0x00, 0x10, 0, *mx.to_bytes(2, 'big'), *value.to_bytes(2, 'big')])
+            msg = bytearray([0x6e, len(payload) | 0x80, *payload])
+            msg.append(reduce(operator.xor, msg, 0x50))
+            if rng.random() < .1:
+                msg[rng.randrange(len(msg))] ^= 1 << rng.randrange(8)
+            stream += msg
+        elif kind < .6:
+            stream += bytes.fromhex('6e 80 be')
+        elif kind < .7:
+            stream += b'\xff' * rng.randrange(1, 20)
+        else:
+            garbage = rng.randbytes(rng.randrange(1, 20))
+            stream += (b'\x6e' if rng.random() < .5 else b'') + garbage
+    return bytes(stream)
+
+
+class StreamDev:
+    '''Stands in for I2cDev with reads from `stream`.'''
+    def __init__(self, stream):
+        self.stream = stream
+        self.pos = 0
+
+    def read(self, length):
+        res = self.stream[self.pos:self.pos+length]
+        self.pos += length
+        return res + b'\xff' * (length - len(res))
+
+    def readinto(self, buffer):
+        res = self.stream[self.pos:self.pos+len(buffer)]
+        buffer[:len(res)] = res
+        buffer[len(res):] = b'\xff' * (len(buffer) - len(res))
+        self.pos += len(buffer)
+        return len(buffer)
+
+
+def bench_parser(args):
+    '''Returns seconds per byte, msgs found and glitches of DdcciMsgReader on a noisy stream.'''
+    stream = noisy_stream(args.parser_bytes, random.Random(args.seed))
+    dev = StreamDev(stream)
+    reader = ddcci.DdcciMsgReader(namespace(resilient=True, waiter=ddcci.FakeWaiter(), _i2c=dev))
+    ddcci.ctx_quirks.set(ddcci.new_quirks())
+    msgs = 0
+    start = time.perf_counter()
+    while dev.pos < len(stream):
+        try:
+            reader.find_next_limited(None)
+        except OSError:
+            continue
+        msgs += 1
+    return dict(per_byte=(time.perf_counter() - start) / dev.pos, msgs=msgs,
+        glitches=reader.glitches)
+
+
+def bench_cli(args, startup_timeout=10):
+    '''Returns wall time percentiles of `d2see.py get` processes asking a daemon that
+    serves a simulated monitor.'''
+    here = os.path.dirname(os.path.abspath(__file__))
+    socket_path = os.path.join(tempfile.mkdtemp(prefix='d2see-bench-'), 'd2see.sock')
+    stderr = tempfile.TemporaryFile('w+')  # a pipe could fill up and block the daemon
+    daemon = subprocess.Popen([sys.executable, os.path.join(here, 'd2see-daemon.py'),
+        '--simulate', '1', '--socket', socket_path], stderr=stderr)
+    command = [sys.executable, os.path.join(here, 'd2see.py'), 'get', hex(args.register),
+        '--socket', socket_path]
+    try:
+        deadline = time.time() + startup_timeout
+        while not os.path.exists(socket_path):
+            if daemon.poll() is not None or time.time() > deadline:
+                daemon.kill()
+                daemon.wait()
+                stderr.seek(0)
+                sys.exit(f'd2see-daemon.py did not start:\n{stderr.read()}')
+            time.sleep(.01)
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)  # value read once
+        times = []
+        for _ in range(args.cli_rounds):
+            start = time.perf_counter()
+            subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+            times.append(time.perf_counter() - start)
+    finally:
+        daemon.terminate()
+        daemon.wait()
+        stderr.close()
+    return percentiles(times)
+
+
+def print_result(result):
+    def ms(value):
+        return '     -' if value is None else f'{value * 1000:6.1f}'
+    r, w = result['delays']
+    read = result['read_latency']
+    confirmed = result['confirmed_write_latency']
+    interactive = result['deadlines']['INTERACTIVE']
+    print(f'{result["bus"]:>12} r={r:.3f} w={w:.3f} | '
+        f'read ms p50 {ms(read["p50"])} p90 {ms(read["p90"])} p99 {ms(read["p99"])} '
+        f'failed {result["reads_failed"]:3} | '
+        f'settled writes/s {result["settled_writes_per_s"]:6.1f} | '
+        f'capabilities ms {ms(result["capabilities_s"])} | '
+        f'confirmed write ms p50 {ms(confirmed["p50"])} p99 {ms(confirmed["p99"])} | '
+        f'interactive missed {interactive["missed"]}/{interactive["served"]}')
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    a = parser.add_argument
+    a('--bus', nargs='*', default=['sim'],
+        help='i2c devices (e.g. /dev/i2c-4) or `sim` for a simulated monitor (default)')
+    a('--delays', nargs='+', default=['.01,.01', '.02,.02', '.05,.05'], metavar='R,W',
+        help='Waiter read and write delays in seconds to benchmark')
+    a('--rounds', type=int, default=100)
+    a('--capability-rounds', type=int, default=3)
+    a('--register', type=lambda x: int(x, 0), default=0x10, help='VCP register to use')
+    a('--load', type=float, default=0, metavar='HZ',
+        help='rereads per second of --load-registers during the controller benchmark')
+    a('--load-registers', nargs='+', type=lambda x: int(x, 0), default=[0x12, 0x14])
+    a('--sim-delays', nargs=2, type=float, default=[.01, .01], metavar=('R', 'W'),
+        help='settle delays of the simulated monitor')
+    a('--sim-noise', type=float, default=0, help='share of simulated replies with bad checksum')
+    a('--scheduler-sizes', nargs='*', type=int, default=[10, 100, 254], metavar='N',
+        help='register counts (up to 254) to measure task picking with')
+    a('--parser-bytes', type=int, default=200000, metavar='N',
+        help='length of the noisy stream to parse (0: skip)')
+    a('--cli-rounds', type=int, default=20, metavar='N',
+        help='headless `d2see.py get` runs against a daemon (0: skip)')
+    a('--seed', type=int, default=0)
+    a('--json', metavar='FILE', help='write results to FILE')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    random.seed(args.seed)
+
+    if 'sim' in args.bus or args.scheduler_sizes:
+        # keep simulated monitors’ delay files out of the real config
+        os.environ['XDG_CONFIG_HOME'] = tempfile.mkdtemp(prefix='d2see-bench-')
+    sim_args = dict(read_delay=args.sim_delays[0], write_delay=args.sim_delays[1],
+        noise_rate=args.sim_noise, seed=args.seed)
+    results = []
+    for bus in args.bus:
+        edid_device = open_edid_device(bus, sim_args)
+        for delays in args.delays:
+            delays = tuple(map(float, delays.split(',')))
+            result = dict(bus=bus, edid_id=edid_device.edid_id, delays=delays)
+            result.update(await bench_mccs(edid_device, delays, args))
+            result.update(await bench_controller(edid_device, delays, args))
+            print_result(result)
+            results.append(result)
+    scheduler = {}
+    for size in args.scheduler_sizes:
+        scheduler[size] = bench_scheduler(size, args)
+        print(f'{size:5} registers | next task µs: queue {scheduler[size]["queue"] * 1e6:7.1f} '
+            f'scan {scheduler[size]["scan"] * 1e6:7.1f}')
+    parsing = None
+    if args.parser_bytes:
+        parsing = bench_parser(args)
+        print(f'parser | ns per byte {parsing["per_byte"] * 1e9:6.1f} | msgs {parsing["msgs"]} '
+            f'glitches {parsing["glitches"]}')
+    headless = None
+    if args.cli_rounds:
+        headless = bench_cli(args)
+        over = ' OVER BUDGET' if headless['p50'] > cli.startup_budget else ''
+        print(f'd2see.py get | ms p50 {headless["p50"] * 1000:6.1f} p90 {headless["p90"] * 1000:6.1f} '
+            f'(budget {cli.startup_budget * 1000:.0f}){over}')
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(dict(time=time.time(), args=vars(args), results=results,
+                scheduler=scheduler, parser=parsing, cli=headless), file, indent=1)
+
+if __name__ == '__main__':
+    sys.exit(trio.run(main))
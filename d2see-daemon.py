@@ -0,0 +1,59 @@
+#!/usr/bin/python3
+'''Runs the d2see daemon: owns all monitors and serves them on a Unix socket (see
+ddcci/daemon.py for the protocol and ddcci/client.py for a client).'''
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+from functools import partial
+
+import trio
+
+from ddcci import client, daemon, ddcci
+
+def simulated_controllers(count, nursery):
+    from ddcci.simulation import SimulatedMonitor
+    # keep simulated monitors’ delay files out of the real config
+    os.environ['XDG_CONFIG_HOME'] = tempfile.mkdtemp(prefix='d2see-sim-')
+    controllers = {}
+    for serial in range(1, count + 1):
+        sim = SimulatedMonitor(serial=serial)
+        edid_device = ddcci.EdidDevice(f'sim-{serial}', i2c_dev=sim.i2c_dev)
+        mc = ddcci.MonitorController(edid_device, nursery)
+        controllers[mc.id] = mc
+    return controllers
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    a = parser.add_argument
+    a('--socket', default=client.socket_path(), help='path of the Unix socket (default: %(default)s)')
+    a('--simulate', type=int, default=0, metavar='N',
+        help='serve N simulated monitors instead of the ones on the i2c buses')
+    a('--debug-levels', nargs=2, default=[20, 10], metavar=('DEF', 'CAT'), type=int,
+        help='sets default log level to DEF and categories mentioned with --debug to level CAT')
+    a('-d', '--debug', nargs='+', default=[],
+        help='e.g. `--debug hw_comm sleep=25`, which sets sleep to level 25 '
+        'and hw_comm’s level to the second number of the `--debug-levels` option')
+    a('--scan-budget', type=float, default=ddcci.MonitorController.scan_budget, metavar='SHARE',
+        help='share of i2c bus time for rereading settings on monitors without change polling')
+    args = parser.parse_args()
+    if not 0 < args.scan_budget <= 1:
+        parser.error('--scan-budget must be more than 0 and at most 1')
+    ddcci.MonitorController.scan_budget = args.scan_budget
+
+    logging.basicConfig(level=args.debug_levels[0])
+    for debug_arg in args.debug:
+        category, *level = debug_arg.rsplit('=', 1)
+        level = int(level[0]) if level else args.debug_levels[1]
+        logging.getLogger(category).setLevel(level)
+
+    make_controllers = partial(simulated_controllers, args.simulate) if args.simulate else None
+    try:
+        await daemon.Daemon(args.socket, make_controllers).run()
+    except OSError as e:
+        return f'd2see-daemon: {e}'
+
+if __name__ == '__main__':
+    sys.exit(trio.run(main))
@@ -1,10 +1,16 @@
 #!/usr/bin/python3
 
+import sys
+
+if __name__ == '__main__' and sys.argv[1:2] and sys.argv[1] in ('get', 'set', 'snapshot', 'calibrate'):
+    # headless: no GUI, X or GTK modules to import
+    from ddcci import cli
+    sys.exit(cli.main())
+
 import argparse
 import inspect
 import logging
 import re
-import sys
 
 import ewmh
 import gi
@@ -99,9 +105,13 @@ def create_windows(monitor_controllers, main_cancel_scope):
             assert edid_atom in display.xrandr_list_output_properties(output).atoms
             randr_edid = bytes(display.xrandr_get_output_property(output, edid_atom, 0, 0, 64).value)
             edid_match = lambda mc, re: mc.edid_device.edid256.startswith(re)
-            mc = next(mc for mc in monitor_controllers if edid_match(mc, randr_edid))
+            mc = next((mc for mc in monitor_controllers if edid_match(mc, randr_edid)), None)
+            if mc is None:  # e.g. a laptop screen or a monitor whose bus is not probed yet
+                continue
             monitor_controllers.remove(mc)
             matching_controllers.append(mc)
+        if not matching_controllers:
+            continue
         monitor_names = list(map(lambda mc: mc.edid_device.edid_id, matching_controllers))
         log(27, 'hw_enum', f'Xrandr {connector_name} is {monitor_names}')
         viewports = ewmh.EWMH().getDesktopViewPort()
@@ -111,16 +121,45 @@ def create_windows(monitor_controllers, main_cancel_scope):
                 windows.append(testpattern.PatternWindow(matching_controllers, desktop_index, main_cancel_scope))
     return windows
 
+class Windows:
+    '''The windows of create_windows() for the monitors a HotplugWatcher has: rebuilt
+    whenever one is found or lost after the coldplug.'''
+    def __init__(self, main_cancel_scope):
+        self.main_cancel_scope = main_cancel_scope
+        self.controllers = []
+        self.windows = None  # until rebuild() after the coldplug
+
+    def found(self, mc):
+        self.controllers.append(mc)
+        if self.windows is not None:
+            self.rebuild()
+
+    def lost(self, mc):
+        self.controllers.remove(mc)
+        if self.windows is not None:
+            self.rebuild()
+
+    def rebuild(self):
+        for window in self.windows or []:
+            window.destroy()
+        self.windows = create_windows(self.controllers, self.main_cancel_scope)
+
 async def main():
     parser = argparse.ArgumentParser(description=
-        'Adjust screen brightness and contrast of multiple monitors all at once.')
+        'Adjust screen brightness and contrast of multiple monitors all at once.',
+        epilog='Without GUI: d2see.py get|set|snapshot|calibrate … (see e.g. d2see.py get --help)')
     a = parser.add_argument
     a('--debug-levels', nargs=2, default=[20, 10], metavar=('DEF', 'CAT'), type=int,
         help='sets default log level to DEF and categories mentioned with --debug to level CAT')
     a('-d', '--debug', nargs='+', default=[],
         help='e.g. `--debug hw_comm sleep=25`, which sets sleep to level 25 '
         'and hw_comm’s level to the second number of the `--debug-levels` option')
+    a('--scan-budget', type=float, default=ddcci.MonitorController.scan_budget, metavar='SHARE',
+        help='share of i2c bus time for rereading settings on monitors without change polling')
     args = parser.parse_args()
+    if not 0 < args.scan_budget <= 1:
+        parser.error('--scan-budget must be more than 0 and at most 1')
+    ddcci.MonitorController.scan_budget = args.scan_budget
 
     logging.basicConfig(level=args.debug_levels[0])
     for debug_arg in args.debug:
@@ -128,9 +167,16 @@ async def main():
         level = int(level[0]) if level else args.debug_levels[1]
         logging.getLogger(category).setLevel(level)
 
-    async with trio.open_nursery() as nursery:
-        mcs = ddcci.MonitorController.coldplug(nursery)
-        create_windows(mcs, nursery.cancel_scope)
+    windows = None
+    try:
+        async with trio.open_nursery() as nursery:
+            windows = Windows(nursery.cancel_scope)
+            watcher = ddcci.HotplugWatcher(nursery, found=windows.found, lost=windows.lost)
+            await nursery.start(watcher.run)  # coldplugged ones are found() as well
+            windows.rebuild()
+    finally:  # e.g. writes tuned delays not saved yet
+        for mc in windows.controllers if windows else []:
+            mc.close()
 
 def trio_gtk_run(trio_main, *trio_main_args):
     """Run Trio and PyGTK together."""
@@ -0,0 +1,168 @@
+'''Headless d2see: `d2see get|set|snapshot|calibrate …` for scripts and hotkeys. Asks the d2see
+daemon if one is running (importing only the standard library) and accesses the monitors
+itself otherwise (importing trio and ddcci.ddcci, but no GUI). Either way the caches on
+disk (EDIDs, delays, quirks, capabilities) spare probing and calibration.'''
+import argparse
+import errno
+import json
+import logging
+import sys
+import time
+
+from ddcci import client
+
+startup_budget = .1  # seconds for a `d2see.py get` process answered by the daemon (see benchmark.py)
+
+def log(frequency, category, msg):
+  logging.getLogger(category).log(frequency, msg)
+
+def parse_args(argv):
+  common = argparse.ArgumentParser(add_help=False)
+  a = common.add_argument
+  a('-m', '--monitor', metavar='ID', help='only this monitor (as printed by get)')
+  a('--socket', default=client.socket_path(), help='of the daemon (default: %(default)s)')
+  a('--no-daemon', action='store_true', help='access the monitors even if a daemon runs')
+  a('--timeout', type=float, default=5, metavar='SECONDS')
+  a('--debug-levels', nargs=2, default=[30, 10], metavar=('DEF', 'CAT'), type=int,
+    help='sets default log level to DEF and categories mentioned with --debug to level CAT')
+  a('-d', '--debug', nargs='+', default=[], help='e.g. `--debug hw_comm sleep=25`')
+  number = lambda x: int(x, 0)
+
+  parser = argparse.ArgumentParser(prog='d2see', description=__doc__.split('\n')[0])
+  commands = parser.add_subparsers(dest='command', required=True)
+  get = commands.add_parser('get', parents=[common], help='print value and max per monitor')
+  get.add_argument('vcp', type=number, help='VCP code, e.g. 0x10 for brightness')
+  get.add_argument('--max-age', type=float, metavar='SECONDS',
+    help='reread values the daemon knows for longer (default: any known value will do)')
+  set_ = commands.add_parser('set', parents=[common], help='write a value on all monitors')
+  set_.add_argument('vcp', type=number)
+  set_.add_argument('value', type=number)
+  snapshot = commands.add_parser('snapshot', parents=[common], help='print all VCP values as JSON')
+  snapshot.add_argument('--recheck', action='store_true',
+    help='read VCP codes found unsupported earlier again (e.g. after a firmware update)')
+  calibrate = commands.add_parser('calibrate', parents=[common],
+    help='measure the delays the monitors need (takes minutes and flickers; no daemon)')
+  calibrate.add_argument('--again', action='store_true', help='also if measured before')
+  return parser.parse_args(argv)
+
+def main(argv=None):
+  start = time.perf_counter()
+  args = parse_args(argv)
+  logging.basicConfig(level=args.debug_levels[0])
+  for debug_arg in args.debug:
+    category, *level = debug_arg.rsplit('=', 1)
+    level = int(level[0]) if level else args.debug_levels[1]
+    logging.getLogger(category).setLevel(level)
+
+  try:
+    if not args.no_daemon:
+      try:
+        connection = client.Client(args.socket, timeout=args.timeout)
+      except (FileNotFoundError, ConnectionRefusedError):
+        log(19, 'cli', f'No daemon on {args.socket}. Accessing the monitors directly.')
+      else:
+        with connection:
+          return _via_daemon(connection, args)
+    import trio  # only now: its import takes longer than all the rest
+    return trio.run(_direct, args)
+  except OSError as e:
+    return f'd2see: {e}'
+  finally:
+    log(19, 'cli', f'{args.command} took {time.perf_counter() - start:.3f}s after imports')
+
+def _via_daemon(connection, args):
+  options = dict(monitor=args.monitor) if args.monitor else {}
+  if args.command == 'get':
+    if args.max_age is not None:
+      options['max_age'] = args.max_age
+    return _print_values(connection.request('get', vcp=args.vcp, **options)['values'])
+  elif args.command == 'set':
+    return _refused(connection.request('set', vcp=args.vcp, value=args.value, **options)['refused'])
+  elif args.command == 'calibrate':
+    raise OSError(errno.EBUSY, 'The daemon uses the monitors. Stop it to calibrate')
+  else:
+    snapshots = connection.request('snapshot', recheck=args.recheck, **options)['snapshots']
+    print(json.dumps(snapshots, indent=1))
+
+async def _direct(args):
+  import trio
+  from ddcci import ddcci
+  found = await ddcci.MonitorController.coldplug(None, timeout=args.timeout)  # no task loops
+  mcs = [mc for mc in found if not args.monitor or mc.id == args.monitor]
+  for mc in mcs:
+    mc._load_capabilities()  # for supports(); only from disk: fetching them takes seconds
+  try:
+    if args.monitor and not mcs:
+      raise ddcci.OSE(errno.ENODEV, 'No such monitor', args.monitor)
+    elif not mcs:
+      raise ddcci.OSE(errno.ENODEV, 'No monitors found')
+    if args.command == 'get':
+      values = {}
+      async def get(mc):
+        try:
+          value, mx, _ = await mc.read(args.vcp)
+        except OSError as e:
+          values[mc.id] = None if e.errno == errno.ENOTSUP else dict(error=str(e))
+        else:
+          values[mc.id] = dict(value=value, max=mx)
+      async with trio.open_nursery() as nursery:
+        for mc in mcs:
+          if mc.supports(args.vcp):
+            nursery.start_soon(get, mc)
+          else:
+            values[mc.id] = None
+      return _print_values(values)
+    elif args.command == 'set':
+      refused = [mc.id for mc in mcs if not mc.supports(args.vcp)]
+      writable = [mc for mc in mcs if mc.id not in refused]
+      if writable:
+        await ddcci.MonitorController.write_synchronized(writable, args.vcp, args.value)
+      failed = {}
+      async def confirm(mc):  # what the task loop of a daemon would do
+        try:
+          if not await mc.confirm_write(args.vcp, args.value):
+            failed[mc.id] = f'value {args.value} does not stick'
+        except OSError as e:
+          failed[mc.id] = str(e)
+      async with trio.open_nursery() as nursery:
+        for mc in writable:
+          nursery.start_soon(confirm, mc)
+      for monitor, error in sorted(failed.items()):
+        print(monitor, 'error:', error, file=sys.stderr)
+      return _refused(refused) or (1 if failed else None)
+    elif args.command == 'calibrate':
+      async def calibrate(mc):
+        with mc._context():
+          await mc._mccs.optimize_delays(again=args.again)
+      async with trio.open_nursery() as nursery:
+        for mc in mcs:
+          nursery.start_soon(calibrate, mc)
+      for mc in sorted(mcs, key=lambda mc: mc.id):
+        waiter = mc._mccs.waiter
+        print(mc.id, f'r={waiter.delay(*ddcci.Waiter.r_entry):.3f}s',
+          f'w={waiter.delay(*ddcci.Waiter.w_entry):.3f}s')
+    else:
+      snapshots = await ddcci.MonitorController.snapshot_all(mcs, recheck=args.recheck)
+      print(json.dumps(snapshots, indent=1))
+  finally:
+    # the next process does not know about our last access: let the monitors settle
+    await trio.sleep(max([0, *(mc._mccs.waiter.earliest('w') - time.time() for mc in found)]))
+    for mc in found:
+      mc.close()
+
+def _print_values(values):
+  failed = False
+  for monitor, value in sorted(values.items()):
+    if value is None:
+      print(monitor, 'unsupported')
+    elif 'error' in value:
+      print(monitor, 'error:', value['error'], file=sys.stderr)
+      failed = True
+    else:
+      print(monitor, value['value'], value['max'])
+  return 1 if failed else None
+
+def _refused(refused):
+  for monitor in refused:
+    print(monitor, 'unsupported', file=sys.stderr)
+  return 1 if refused else None
@@ -0,0 +1,63 @@
+'''Blocking client of the d2see daemon (see daemon.py). Standard library only, so that
+short-lived tools start fast.'''
+import errno
+import json
+import socket
+
+from ddcci import xdg
+
+def socket_path():
+  return xdg.runtime_path('d2see.sock')
+
+class Client:
+  '''One connection to the daemon. request() sends one request and returns its reply;
+  events (after a subscribe request) are kept for events().'''
+  def __init__(self, path=None, timeout=10):
+    self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+      self._sock.settimeout(timeout)
+      self._sock.connect(path or socket_path())
+    except OSError:
+      self._sock.close()
+      raise
+    self._file = self._sock.makefile('rb')
+    self._next_id = 0
+    self._events = []
+
+  def close(self):
+    self._file.close()
+    self._sock.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+  def request(self, op, **args):
+    '''E.g. request('get', vcp=0x10). Returns the reply (a dict). Raises OSError with the
+    daemon’s errno (EIO if it did not give one) on an error reply.'''
+    self._next_id += 1
+    self._sock.sendall(json.dumps(dict(args, op=op, id=self._next_id)).encode() + b'\n')
+    while True:
+      msg = self._receive()
+      if 'event' in msg:
+        self._events.append(msg)
+      elif msg.get('id') == self._next_id:
+        break
+    if 'error' in msg:
+      raise OSError(msg.get('errno') or errno.EIO, msg['error'])
+    return msg
+
+  def events(self):
+    '''Yields events, waiting for them (timeout permitting) forever.'''
+    while True:
+      while self._events:
+        yield self._events.pop(0)
+      self._events.append(self._receive())
+
+  def _receive(self):
+    line = self._file.readline()
+    if not line:
+      raise OSError(errno.ECONNRESET, 'd2see daemon closed the connection')
+    return json.loads(line)
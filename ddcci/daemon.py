@@ -0,0 +1,241 @@
+'''The d2see daemon owns the MonitorControllers of all monitors (following hotplug) and
+serves them on a Unix socket: probing the buses, learning delays and reading values is done
+once instead of by every short-lived tool. Values known to the task loops are answered
+without touching the bus.
+
+Protocol: one JSON object per line in both directions. Requests have an `op`, replies
+echo the request’s `id` (if any) and have `error` (and possibly `errno`) on failure.
+Requests are handled concurrently, so replies may come in another order. `monitor`
+(a monitor id as in `list`) restricts a request to one monitor, otherwise all are meant.
+
+* {"op": "list"} → {"monitors": [{"id", "model_id", "file_name"}, …]}
+* {"op": "get", "vcp": 16, "max_age": .5} → {"values": {monitor id: {"value", "max", "age"},
+  {"error"} (e.g. no value read within Daemon.get_timeout) or null if unsupported}}; with
+  `max_age` (optional), values older than that many seconds are read again first (see
+  MonitorController.get()). `age` is null for values not read back yet
+* {"op": "snapshot", "recheck": false} → {"snapshots": {monitor id:
+  MonitorController.snapshot()}}; `recheck` (optional) reads codes found unsupported again
+* {"op": "set", "vcp": 16, "value": 40} → {"refused": [ids of monitors without VCP 16]}
+  once the others got the write at (nearly) the same moment (see
+  MonitorController.write_synchronized()); rereading and rewriting happen in the background
+* {"op": "fade", "vcp": 16, "value": 40, "duration": 1.5} → {"refused": […]}; the fade
+  happens in the background
+* {"op": "subscribe", "vcp": 16} → {"refused": […]}; then
+  {"event": "value", "monitor", "vcp", "value"} with the current value and on every change
+  until the client stops sending
+
+VCP codes range from 0 to 0xff and values from 0 to 0xffff (EINVAL otherwise).
+'''
+import errno
+import json
+import logging
+import math
+import os
+import signal
+
+import trio
+
+from ddcci import client, ddcci
+
+def log(frequency, category, msg):
+  logging.getLogger(category).log(frequency, msg)
+
+class Daemon:
+  '''Serves MonitorControllers on the socket at `path`: those of a HotplugWatcher or, if
+  given, those returned by `make_controllers(nursery)` (by monitor id).'''
+  get_timeout = 5  # seconds to wait for a value never read before
+
+  def __init__(self, path=None, make_controllers=None):
+    self.path = path or client.socket_path()
+    self._make_controllers = make_controllers
+    self.controllers = {}  # by monitor id
+    self._nursery = None
+
+  async def run(self, *, dev_dir='/dev', task_status=trio.TASK_STATUS_IGNORED):
+    '''Listen, then coldplug, call task_status.started() and serve until cancelled (or
+    SIGINT/SIGTERM).'''
+    listener = await self._listen()
+    try:
+      async with trio.open_nursery() as nursery:
+        self._nursery = nursery
+        nursery.start_soon(_cancel_on_signals, nursery.cancel_scope)
+        if self._make_controllers:
+          self.controllers.update(self._make_controllers(nursery))
+        else:
+          watcher = ddcci.HotplugWatcher(nursery, found=self._found, lost=self._lost,
+            dev_dir=dev_dir)
+          for mc in await nursery.start(watcher.run):
+            self._found(mc)
+        log(27, 'daemon', f'Serving {len(self.controllers)} monitor(s) on {self.path}')
+        task_status.started()
+        await trio.serve_listeners(self._serve, [listener], handler_nursery=nursery)
+    finally:
+      os.unlink(self.path)
+      for mc in self.controllers.values():
+        mc.close()
+
+  def _found(self, mc):
+    self.controllers[mc.id] = mc
+
+  def _lost(self, mc):
+    if self.controllers.get(mc.id) is mc:
+      del self.controllers[mc.id]
+
+  async def _listen(self):
+    '''Binds the socket, replacing a stale one. Raises EADDRINUSE if a daemon serves it.'''
+    if os.path.exists(self.path):
+      with trio.socket.socket(trio.socket.AF_UNIX, trio.socket.SOCK_STREAM) as probe:
+        try:
+          await probe.connect(self.path)
+        except OSError:
+          os.unlink(self.path)
+        else:
+          raise ddcci.OSE(errno.EADDRINUSE, 'A d2see daemon is running already', self.path)
+    sock = trio.socket.socket(trio.socket.AF_UNIX, trio.socket.SOCK_STREAM)
+    try:
+      await sock.bind(self.path)
+      os.chmod(self.path, 0o600)
+      sock.listen()
+    except OSError:
+      sock.close()
+      raise
+    return trio.SocketListener(sock)
+
+  async def _serve(self, stream):
+    send_channel, receive_channel = trio.open_memory_channel(math.inf)  # replies and events
+    subscriptions = []  # (setting, callback)
+    async with stream, trio.open_nursery() as nursery:
+      nursery.start_soon(self._send_all, stream, receive_channel)
+      try:
+        async with trio.open_nursery() as requests:
+          try:
+            async for line in _lines(stream):
+              requests.start_soon(self._respond, line, send_channel, subscriptions)
+          except (trio.BrokenResourceError, OSError) as e:
+            log(24, 'daemon', f'Dropping client: {e!r}')
+            requests.cancel_scope.cancel()
+      finally:  # replies to requests before end of input are sent nevertheless
+        for setting, callback in subscriptions:
+          setting.listeners.discard(callback)
+        send_channel.close()
+
+  @staticmethod
+  async def _send_all(stream, receive_channel):
+    try:
+      async for msg in receive_channel:
+        await stream.send_all(json.dumps(msg).encode() + b'\n')
+    except (trio.BrokenResourceError, trio.ClosedResourceError):
+      pass  # client gone
+
+  async def _respond(self, line, send_channel, subscriptions):
+    if not line.strip():
+      return
+    reply = {}
+    try:
+      request = json.loads(line)
+      if 'id' in request:
+        reply['id'] = request['id']
+      handler = getattr(self, f'_op_{request["op"]}', None)
+      if handler is None:
+        raise ValueError(f'Unknown op {request["op"]!r}')
+      reply.update(await handler(request, send_channel, subscriptions))
+    except OSError as e:
+      reply.update(error=str(e), errno=e.errno)
+    except (ValueError, KeyError, TypeError) as e:  # json.JSONDecodeError is a ValueError
+      reply.update(error=f'Bad request: {e!r}', errno=errno.EINVAL)
+    send_channel.send_nowait(reply)
+
+  def _selected(self, request):
+    if 'monitor' not in request:
+      return list(self.controllers.values())
+    mc = self.controllers.get(request['monitor'])
+    if mc is None:
+      raise ddcci.OSE(errno.ENODEV, 'No such monitor', request['monitor'])
+    return [mc]
+
+  async def _op_list(self, request, *_):
+    return dict(monitors=[dict(id=mc.id, model_id=mc.edid_device.model_id,
+      file_name=mc.edid_device.file_name) for mc in self._selected(request)])
+
+  async def _op_get(self, request, *_):
+    vcp = int(request['vcp'])
+    ddcci.check_vcp(vcp)
+    max_age = request.get('max_age')
+    max_age = None if max_age is None else float(max_age)
+    values = {}
+    async def get(mc):
+      try:
+        with trio.fail_after(self.get_timeout):
+          value, mx = await mc.get(vcp, max_age)
+      except trio.TooSlowError:
+        values[mc.id] = dict(error='No value read yet') if mc.supports(vcp) else None
+      except OSError as e:
+        values[mc.id] = None if e.errno == errno.ENOTSUP else dict(error=str(e))
+      else:
+        values[mc.id] = dict(value=value, max=mx, age=mc.setting(vcp).age())
+    mcs = self._selected(request)
+    async with trio.open_nursery() as nursery:
+      for mc in mcs:
+        nursery.start_soon(get, mc)
+    return dict(values=values)
+
+  async def _op_snapshot(self, request, *_):
+    return dict(snapshots=await ddcci.MonitorController.snapshot_all(self._selected(request),
+      recheck=bool(request.get('recheck'))))
+
+  async def _op_set(self, request, *_):
+    vcp, value = int(request['vcp']), int(request['value'])
+    ddcci.check_vcp(vcp, value)
+    mcs = self._selected(request)
+    refused = [mc.id for mc in mcs if not mc.supports(vcp)]
+    await ddcci.MonitorController.write_synchronized(
+      [mc for mc in mcs if mc.id not in refused], vcp, value)
+    return dict(refused=refused)
+
+  async def _op_fade(self, request, *_):
+    vcp, value, duration = int(request['vcp']), int(request['value']), float(request['duration'])
+    ddcci.check_vcp(vcp, value)
+    refused = []
+    for mc in self._selected(request):
+      if mc.supports(vcp):
+        self._nursery.start_soon(_fade, mc, vcp, value, duration)
+      else:
+        refused.append(mc.id)
+    return dict(refused=refused)
+
+  async def _op_subscribe(self, request, send_channel, subscriptions):
+    vcp = int(request['vcp'])
+    ddcci.check_vcp(vcp)
+    refused = []
+    for mc in self._selected(request):
+      if not mc.supports(vcp):
+        refused.append(mc.id)
+        continue
+      def callback(value, monitor=mc.id):
+        send_channel.send_nowait(dict(event='value', monitor=monitor, vcp=vcp, value=value))
+      mc.add_listeners(vcp, callback)
+      subscriptions.append((mc.setting(vcp), callback))
+    return dict(refused=refused)
+
+async def _fade(mc, *args):
+  try:
+    await mc.fade(*args)
+  except OSError as e:  # the client got its reply already
+    log(24, 'daemon', f'{mc.id}: fade failed: {e}')
+
+async def _cancel_on_signals(cancel_scope):
+  with trio.open_signal_receiver(signal.SIGINT, signal.SIGTERM) as signals:
+    async for signum in signals:
+      log(27, 'daemon', f'Stopping on {signal.Signals(signum).name}')
+      cancel_scope.cancel()
+
+async def _lines(stream, max_length=65536):
+  '''Yields the lines (without b'\\n') received on `stream` until it is closed.'''
+  buffer = bytearray()
+  async for data in stream:
+    buffer += data
+    *lines, buffer = buffer.split(b'\n')
+    for line in lines:
+      yield line
+    if len(buffer) > max_length:
+      raise ddcci.OSE(errno.EMSGSIZE, 'Request line too long')
@@ -18,20 +18,28 @@
 
 import contextlib
 import contextvars
+import ctypes
 import enum
 import errno
 import fcntl
+import fnmatch
 import glob
+import heapq
+import itertools
+import json
 import logging
+import math
 import operator
 import os
 import random
+import re
+import struct
 import time
 from functools import partial, reduce
 from types import SimpleNamespace as namespace
 
 import trio
-from ddcci import xdg
+from ddcci import inotify, xdg
 
 # 1 i2c messages
 # 2 i2c-dev messages
@@ -280,6 +288,13 @@ def log(frequency, category, msg):
     msg = f'{mon} {msg}'
   logging.getLogger(category).log(frequency, msg)
 
+def check_vcp(register, value=None):
+  '''Raises EINVAL unless `register` (and `value`) fit into a VCP request.'''
+  if not 0 <= register <= 0xff:
+    raise OSE(errno.EINVAL, 'VCP code out of range', register)
+  elif value is not None and not 0 <= value <= 0xffff:
+    raise OSE(errno.EINVAL, 'VCP value out of range', value)
+
 
 # resilient operation means: compensate errors
 # non-resilient means: do _only_ what was asked for as dumb as possible
@@ -288,12 +303,33 @@ def log(frequency, category, msg):
 #  * this API needs to rely on external Waiter() for WouldBlockTime exceptions
 #  * this Waiter() decides if the non-blocking API is really non-blocking...
 
+class _I2cMsg(ctypes.Structure):  # struct i2c_msg of linux/i2c.h
+  _fields_ = [('addr', ctypes.c_uint16), ('flags', ctypes.c_uint16), ('len', ctypes.c_uint16),
+    ('buf', ctypes.POINTER(ctypes.c_uint8))]
+
+class _I2cRdwrIoctlData(ctypes.Structure):  # of linux/i2c-dev.h
+  _fields_ = [('msgs', ctypes.POINTER(_I2cMsg)), ('nmsgs', ctypes.c_uint32)]
+
+
 class I2cDev:
   def __init__(self, file_name, i2c_slave_addr, *, resilient=False):
     self._dev = os.open(file_name, os.O_RDWR)
     self.resilient = resilient
     self._max_tries = 5
+    self._addr = i2c_slave_addr
     fcntl.ioctl(self._dev, 0x0703, i2c_slave_addr)  # CPP macro: I2C_SLAVE
+    self.combined = self._supports_combined()  # see transfer()
+
+  def _supports_combined(self):
+    funcs = bytearray(struct.calcsize('L'))
+    try:
+      fcntl.ioctl(self._dev, 0x0705, funcs)  # CPP macro: I2C_FUNCS
+    except OSError:
+      return False
+    return bool(struct.unpack('L', funcs)[0] & 0x1)  # I2C_FUNC_I2C (i.e. I2C_RDWR works)
+
+  def close(self):
+    os.close(self._dev)
 
   def _operate(self, func, *args):
     already_tried = 0
@@ -315,6 +351,19 @@ class I2cDev:
 
   def read(self, length):
     result = self._operate(os.read, length)
+    self._log_read(result)
+    return result
+
+  def readinto(self, buffer):
+    '''Like read(len(buffer)), but into `buffer` (e.g. a memoryview slice). Returns the length.'''
+    def readinto(fd, buffer):
+      return os.readv(fd, [buffer])
+    length = self._operate(readinto, buffer)
+    self._log_read(buffer[:length])
+    return length
+
+  @staticmethod
+  def _log_read(result):
     level = logging.getLogger('hw_comm').getEffectiveLevel()
     if level < 10 or len(result) < 20:  # log in full
       msg = f'read: {result.hex(" ")}'
@@ -322,13 +371,40 @@ class I2cDev:
       msg = f'read: {result[:19].hex(" ")} ...'
     loglevel = 9 if level < 10 else 12
     log(loglevel, 'hw_comm', msg)
-    return result
 
   def write(self, buffer):
     result = self._operate(os.write, buffer)
     log(12, 'hw_comm', f'write: {buffer.hex(" ")}')
     return result
 
+  def transfer(self, buffer, read_buffer):
+    '''Writes `buffer` and reads into `read_buffer` right after, i.e. with a repeated start
+    instead of a stop. It is one I2C_RDWR ioctl (retried as a whole) if `combined`,
+    otherwise write() and readinto(). Returns the length read.'''
+    if self.combined:
+      try:
+        length = self._operate(self._rdwr, buffer, read_buffer)
+      except OSError as e:
+        if e.errno not in (errno.EOPNOTSUPP, errno.EINVAL, errno.ENOTTY):
+          raise
+        log(25, 'hw_comm', f'Combined transfers fail ({e.strerror}). Falling back to write and read.')
+        self.combined = False
+      else:
+        log(12, 'hw_comm', f'write: {buffer.hex(" ")} (combined)')
+        self._log_read(read_buffer[:length])
+        return length
+    self.write(buffer)
+    return self.readinto(read_buffer)
+
+  def _rdwr(self, fd, buffer, read_buffer):
+    write = (ctypes.c_uint8 * len(buffer)).from_buffer_copy(buffer)
+    read = (ctypes.c_uint8 * len(read_buffer)).from_buffer(read_buffer)
+    pointer = ctypes.POINTER(ctypes.c_uint8)
+    msgs = (_I2cMsg * 2)(_I2cMsg(self._addr, 0, len(buffer), ctypes.cast(write, pointer)),
+      _I2cMsg(self._addr, 0x1, len(read_buffer), ctypes.cast(read, pointer)))  # I2C_M_RD
+    fcntl.ioctl(fd, 0x0707, _I2cRdwrIoctlData(msgs, 2))  # CPP macro: I2C_RDWR
+    return len(read_buffer)
+
   def measure(self):
     observed_max = .00023, .0005  # latter often ~.0003
     def time_it(amount):
@@ -358,14 +434,55 @@ class I2cDev:
     return measured
 
 
+def adapter_name(file_name):
+  '''Returns the kernel’s name of the i2c adapter behind `file_name` (e.g. /dev/i2c-4).
+  Unlike the bus number it is stable across reboots. Falls back to `file_name`.'''
+  sysfs_name = os.path.join('/sys/class/i2c-dev', os.path.basename(file_name), 'name')
+  try:
+    with open(sysfs_name) as file:
+      return file.read().strip()
+  except OSError:
+    return file_name
+
+
+class EdidCache:
+  '''Remembers which EDID was found on which i2c adapter (see adapter_name()). Adapters
+  sharing a name only cost a full EDID read on a mismatch, never a wrong identity.'''
+  def __init__(self, open_config):
+    self.open_config = open_config
+    with open_config() as file:
+      try:
+        raw = json.loads(file.read() or '{}')
+      except ValueError:
+        log(29, 'hw_enum', 'Ignoring unreadable EDID cache.')
+        raw = {}
+    self._edids = {adapter: bytes.fromhex(edid) for adapter, edid in raw.items()}
+    self._changed = False
+
+  def get(self, adapter):
+    return self._edids.get(adapter)
+
+  def update(self, adapter, edid256):
+    if self._edids.get(adapter) != edid256:
+      self._edids[adapter] = bytes(edid256)
+      self._changed = True
+
+  def save(self):
+    if self._changed:
+      with self.open_config(mode='w') as file:
+        json.dump({adapter: edid.hex() for adapter, edid in self._edids.items()}, file, indent=1)
+      self._changed = False
+
+
 class EdidDevice:
-  def __init__(self, file_name):
-    dev = I2cDev(file_name=file_name, i2c_slave_addr=0x50, resilient=True)
-    candidate = dev.read(512)  # current position unknown to us
-    start = candidate.find(bytes.fromhex('00 FF FF FF FF FF FF 00'))
-    if start < 0:
-      raise OSE(errno.ENXIO, 'No EDID device found', file_name)
-    edid = candidate[start:start+256]
+  # header, manufacturer, product code, serial number, manufacturing week/year
+  identifying_len = 18
+
+  def __init__(self, file_name, cache=None, *, i2c_dev=I2cDev):
+    '''`i2c_dev` opens the bus (for EDID and later DDC/CI); anything with the signature
+    and read()/write()/close() of I2cDev can stand in for it.'''
+    with contextlib.closing(i2c_dev(file_name=file_name, i2c_slave_addr=0x50, resilient=True)) as dev:
+      edid = self._read_edid(dev, file_name, cache)
     manu_code = int.from_bytes(edid[8:10], 'big')
     manufacturer = ''
     for i in range(3):
@@ -373,9 +490,44 @@ class EdidDevice:
       manu_code >>= 5
     self.edid256 = edid  # always 256 bytes long even for 128 byte EDIDs
     self.edid_id = manufacturer + edid[10:18].hex()  # PC/SN, manufacturing date
+    self.model_id = manufacturer + edid[10:12].hex()  # PC
     self.file_name = file_name
+    self.i2c_dev = i2c_dev
     log(28, 'hw_enum', f'{self.edid_id} is {self.file_name}')
 
+  @staticmethod
+  def _read_edid(dev, file_name, cache):
+    adapter = adapter_name(file_name)
+    edid = cache and cache.get(adapter)
+    if edid and not EdidDevice._is_still_attached(dev, edid):
+      log(25, 'hw_enum', f'{file_name} ({adapter}) has a different EDID than last time.')
+      edid = None
+    if not edid:
+      # read only: the bus may not be a monitor’s (e.g. SPD EEPROMs also sit at 0x50)
+      candidate = dev.read(512)  # current position unknown to us
+      start = candidate.find(bytes.fromhex('00 FF FF FF FF FF FF 00'))
+      if start < 0:
+        raise OSE(errno.ENXIO, 'No EDID device found', file_name)
+      edid = bytes(candidate[start:start+256])
+      if cache:
+        cache.update(adapter, edid)
+    return edid
+
+  @staticmethod
+  def _is_still_attached(dev, edid):
+    '''Reads only the identifying start of the EDID (instead of 512 bytes) and compares.
+    Setting the EEPROM offset is a write: only done on buses cached as a monitor’s.'''
+    return EdidDevice._read_at_start(dev, EdidDevice.identifying_len) == edid[:EdidDevice.identifying_len]
+
+  @staticmethod
+  def _read_at_start(dev, length):
+    offset = bytes([0])  # EEPROM offset: start of EDID
+    if getattr(dev, 'combined', False):
+      res = bytearray(length)
+      return bytes(res[:dev.transfer(offset, res)])
+    dev.write(offset)
+    return dev.read(length)
+
   @classmethod
   def match_edids(cls, monitor):
       for edev in cls.devices:
@@ -421,46 +573,69 @@ def variant(method, /, *, asynch=False, sync=False):
 
 
 class DdcciMsgReader:
-  source_addr, length_byte, op_code = [property(lambda self, _i=i: self._buffer[_i]) for i in range(3)]
-  length_byte_ok = property(lambda self: self.length_byte & 0x80)
-  mccs_length = property(lambda self: self.length_byte & ~0x80)
-  mccs_payload = property(lambda self: self._buffer[2:self.mccs_length+2])
-  # 3 → source addr, length_byte, checksum
-  ddc_length = property(lambda self: self.mccs_length + 3)
-  missing_ddc_bytes = property(lambda self: max(0, self.ddc_length - len(self._buffer)))
-  checksum_ok = property(lambda self: reduce(operator.xor, self._buffer[:self.ddc_length]) == 0x50)
-  is_empty = property(lambda self: len(self._buffer) == 0)
-  ddc_debug_peak = property(lambda self: self._buffer[:MccsOp.ddc_most_msg_len()].hex(" "))
+  '''Finds DDC/CI msgs in what is read from the bus. Reads go into a preallocated buffer;
+  unconsumed bytes lie between the cursors `_start` and `_end` and are moved to the front
+  only when a read would not fit behind them (i.e. no copying on resync).'''
+  capacity = 128
+  source_addr = 0x6e  # begin of every reply/reaction
+  null_length_byte = 0x80  # with a valid checksum: null msg '6e 80 be'
 
   def __init__(self, ddcci, /):
-    self._buffer = bytearray()
+    self._buffer = bytearray(DdcciMsgReader.capacity)
+    self._view = memoryview(self._buffer)
+    # running XORs for checksums: _xors[i] ^ _xors[j] is the XOR of the buffer from i
+    # to j for any _start <= i <= j <= _xored (of the same resync, see _xor())
+    self._xors = bytearray(DdcciMsgReader.capacity + 1)
+    self._xored = 0
+    self._start = self._end = 0
     self._ddcci = ddcci
+    self._readinto = getattr(ddcci._i2c, 'readinto', None) or self._read_copy
+    # of the find_next_limited() in progress (it continues after WouldBlockTime)
+    self._refills = 0
+    self._missing_bytes = 0
+    self._max_len = MccsOp.ddc_max_msg_len()
+    self._most_len = MccsOp.ddc_most_msg_len()
+    self._ops = {op.op_code: (op, op.ddc_min_len, op.ddc_max_len) for op in MccsOp}
+    self.glitches = 0  # checksum mismatches and null msgs (hints to read too early)
+    self.null_msgs = 0
+
+  def new_search(self):
+    '''Forget about an unfinished find_next_limited() (e.g. a new request was sent).'''
+    self._refills = self._missing_bytes = 0
 
   def find_next_limited(self, op_hint):
     chopped_reads = ctx_quirks.get().chopped_reads
-    last_missing_bytes = False
-    for refill in range(3 if self._ddcci.resilient else 2):  # 1 or 2 refills
-      if refill:  # first is 0
-        self._refill(op_hint, missing_bytes)
+    while True:
+      if self._refills:  # first look into the buffer, then refill once or twice
+        self._refill(op_hint, self._missing_bytes)
       from_start, msg, missing_bytes = self._evaluate(op_hint)
       if msg:
-        if last_missing_bytes:
+        if self._missing_bytes:
           if from_start:
             chopped_reads.yes()
           else:
             chopped_reads.no()
+        self.new_search()
         return msg
-      elif last_missing_bytes:
+      elif self._missing_bytes:
         chopped_reads.no()
-      last_missing_bytes = missing_bytes
-    raise OSE(errno.EIO, f'no msg with hint {op_hint}'
-      f' in {"non-" if not self._ddcci.resilient else ""}resilient read')
-
-  def _refill(self, op_hint, missing_bytes):
+      self._missing_bytes = missing_bytes
+      self._refills += 1
+      if self._refills == (3 if self._ddcci.resilient else 2):
+        self.new_search()
+        raise OSE(errno.EIO, f'no msg with hint {op_hint}'
+          f' in {"non-" if not self._ddcci.resilient else ""}resilient read')
+
+  def refill_combined(self, op_hint, request):
+    '''Fill the buffer with what comes right after writing the framed `request` in one
+    combined transfer (see I2cDev.transfer()).'''
+    self._refill(op_hint, 0, request)
+
+  def _refill(self, op_hint, missing_bytes, request=None):
     if isinstance(op_hint, int):
       amount = op_hint
     else:
-      amount = MccsOp.ddc_most_msg_len() if op_hint is None else op_hint.ddc_max_len
+      amount = self._most_len if op_hint is None else op_hint.ddc_max_len
       if self._ddcci.resilient:
         chopped_reads = ctx_quirks.get().chopped_reads
         if chopped_reads:
@@ -470,24 +645,45 @@ class DdcciMsgReader:
             amount += 1
         else:
           amount += 5
-    self._ddcci.waiter.prepare('r', op_hint=op_hint)
-    self._buffer.extend(self._ddcci._i2c.read(amount))
-
-  def _move_to_start(self):
-    index = self._buffer.find(0x6e)  # “source address”; begin of every reply/reaction
-    if index == 0:
-      return False
-    elif index == -1:
-      self._buffer.clear()
+    self._ddcci.waiter.prepare('r')
+    if self._end + amount > len(self._buffer):
+      self._make_room(amount)
+    target = self._view[self._end:self._end+amount]
+    self._end += self._ddcci._i2c.transfer(request, target) if request else self._readinto(target)
+
+  def _read_copy(self, buffer):
+    '''readinto() for stand-ins of I2cDev which only read().'''
+    data = self._ddcci._i2c.read(len(buffer))
+    buffer[:len(data)] = data
+    return len(data)
+
+  def _make_room(self, amount):
+    used = self._end - self._start
+    if used + amount > len(self._buffer):  # (int op_hint) larger than ever before
+      buffer = bytearray(max(2 * len(self._buffer), used + amount))
+      buffer[:used] = self._view[self._start:self._end]
+      self._buffer, self._view = buffer, memoryview(buffer)
+      self._xors = bytearray(len(buffer) + 1)
     else:
-      del self._buffer[0:index]
-    return True
+      self._view[:used] = self._view[self._start:self._end]
+    self._start, self._end, self._xored = 0, used, 0
+
+  def _xor(self, start, stop):
+    '''XOR of the buffer from `start` to `stop`. The running XORs behind it are kept
+    (see _xors), so overlapping candidate frames (e.g. on resync) XOR each byte once.'''
+    xored = max(self._xored, start)
+    if stop > xored:
+      self._xors[xored:stop+1] = itertools.accumulate(self._view[xored:stop], operator.xor,
+        initial=self._xors[xored])
+      self._xored = stop
+    return self._xors[start] ^ self._xors[stop]
 
   def _evaluate(self, op_hint):
     '''Returns three-tuple: from_start, msg, missing_bytes. from_start is True if a msg
     could be detected without skipping bytes, otherwise False. msg is the message found
     or None. missing_bytes indicates the bytes missing from a potential message fragment
-    to be completed. An empty buffer leads to (True, None, 0). This is the only case in
+    to be completed. msg is a memoryview into the buffer: valid until the next refill.
+    An empty buffer leads to (_, None, 0). This is the only case in
     which msg and missing_bytes are falsy.
 
     from_start helps to determine if chopped reads are supported: two consecutive calls
@@ -495,75 +691,116 @@ class DdcciMsgReader:
     is. With the main point being that the first call returns positive missing_bytes and
     the second has a True from_start and a msg.
     '''
+    buffer, end = self._buffer, self._end
     from_start = True
     while True:
-      if self._move_to_start():
+      start = buffer.find(DdcciMsgReader.source_addr, self._start, end)
+      if start != self._start:
         from_start = False
-      invalid = 0  # known minimum amount which can be skipped in search for msg
-      if self.is_empty:
+      if start == -1:
+        self._start = self._end = self._xored = 0
         return from_start, None, 0
-      elif len(self._buffer) == 1:
+      self._start = start
+      available = end - start
+      invalid = 0  # known minimum amount which can be skipped in search for msg
+      if available == 1:
         return from_start, None, (op_hint.ddc_min_len if isinstance(op_hint, MccsOp) else
-          MccsOp.ddc_most_msg_len()) - 1
-      elif not self.length_byte_ok:
+          self._most_len) - 1
+      length_byte = buffer[start+1]
+      ddc_length = (length_byte & 0x7f) + 3  # source addr, length byte and checksum
+      if not length_byte & 0x80:
         invalid = 1
-      elif self.ddc_length > MccsOp.ddc_max_msg_len():
+      elif ddc_length > self._max_len:
         # larger not allowed, but possible, but extremely unlikely
         invalid = 2
-      elif self.missing_ddc_bytes:
-        return from_start, None, self.missing_ddc_bytes
-      elif not self.checksum_ok:
-        log(29, 'hw_comm', f'DDC/CI checksum mismatch {self.ddc_debug_peak}')
+      elif ddc_length > available:
+        return from_start, None, ddc_length - available
+      elif self._xor(start, start+ddc_length) != 0x50:
+        log(29, 'hw_comm', f'DDC/CI checksum mismatch {self._view[start:start+self._most_len].hex(" ")}')
+        self.glitches += 1
         invalid = 2
-      elif self._buffer.startswith(bytes.fromhex('6e 80 be')):
+      elif length_byte == DdcciMsgReader.null_length_byte:
         log(25, 'hw_comm', 'Null msg encountered. Ignoring.')  # might mean “not supported”...
+        self.glitches += 1
+        self.null_msgs += 1
         invalid = 3
       else:
-        try:
-          op = MccsOp(self.op_code)
-        except ValueError:
-          log(29, 'hw_comm', f'Unknown MCCS op {self.op_code:#x}; {self.ddc_debug_peak}')
+        op_code = buffer[start+2]
+        if op_code not in self._ops:
+          log(29, 'hw_comm', f'Unknown MCCS op {op_code:#x}; {self._view[start:start+self._most_len].hex(" ")}')
           invalid = 2
         else:
-          if not (op.ddc_min_len <= self.ddc_length <= op.ddc_max_len):
+          op, min_len, max_len = self._ops[op_code]
+          if not (min_len <= ddc_length <= max_len):
             invalid = 3
           else:
-            msg = self.mccs_payload
-            if isinstance(op_hint, MccsOp) and self.op_code != op_hint.op_code:
+            msg = self._view[start+2:start+ddc_length-1]
+            if isinstance(op_hint, MccsOp) and op is not op_hint:
               log(29, 'hw_comm', f'Dropping unexpected msg: {msg.hex(" ")}')
-              invalid = self.ddc_length
+              invalid = ddc_length
             else:
-              del self._buffer[:self.ddc_length]
-              log(9, 'hw_comm', f'msg: {msg}')
+              self._start += ddc_length
+              if self._start == end:
+                self._start = self._end = self._xored = 0
+              log(9, 'hw_comm', f'msg: {msg.hex(" ")}')
               return from_start, msg, 0
       from_start = False
-      del self._buffer[:invalid]
+      self._start += invalid
 
 
 class Ddcci:
-  def __init__(self, *, file_name, waiter, resilient=False):
+  glitches = property(lambda self: self._reader.glitches)
+  null_msgs = property(lambda self: self._reader.null_msgs)
+
+  def __init__(self, *, file_name, waiter, resilient=False, i2c_dev=I2cDev):
     self.resilient = resilient
     self.waiter = waiter
-    self._i2c = I2cDev(i2c_slave_addr=0x37, file_name=file_name, resilient=resilient)
+    self._i2c = i2c_dev(i2c_slave_addr=0x37, file_name=file_name, resilient=resilient)
     self._reader = DdcciMsgReader(self)
 
+  def close(self):
+    self._i2c.close()
+
+  # payload → framed msg for requests without values (few distinct ones, sent often)
+  _framed = {}
+  _framed_ops = {0x01, 0xf3}  # MccsOp READ and CAPABILITIES
+
   @staticmethod
   def ddc2i2c(buffer):
-    ba = bytearray(buffer)
-    ba.insert(0, len(ba) | 0x80)
-    ba.insert(0, 0x51)
-    ba.append(reduce(operator.xor, ba, 0x6e))
-    return ba
-
-  def write_nowait(self, buffer):
-    self.waiter.prepare('w')
-    res = self._i2c.write(Ddcci.ddc2i2c(buffer))
+    framed = Ddcci._framed.get(buffer) if type(buffer) is bytes else None
+    if framed is None:
+      length_byte = len(buffer) | 0x80
+      # checksum includes the destination address 0x6e
+      framed = bytes((0x51, length_byte, *buffer, reduce(operator.xor, buffer, 0x6e ^ 0x51 ^ length_byte)))
+      if buffer[0] in Ddcci._framed_ops:
+        Ddcci._framed[bytes(buffer)] = framed
+    return framed
+
+  def write_nowait(self, buffer, reply_hint=None):
+    '''With a `reply_hint` (see read_nowait()) and no delay required before reading the
+    reply, the reply is fetched in the same combined i2c transfer (for read_nowait()).'''
+    self.waiter.prepare('w', buffer[0])
+    framed = Ddcci.ddc2i2c(buffer)
+    if reply_hint and getattr(self._i2c, 'combined', False) and self.waiter.earliest('r') <= time.time():
+      self._reader.refill_combined(reply_hint, framed)
+      res = len(framed)
+    else:
+      res = self._i2c.write(framed)
+    self._reader.new_search()
     return res
 
   write = variant(write_nowait, asynch=True)
 
+  def write_burst_nowait(self, buffers):
+    '''Write several msgs back-to-back with only one delay before them.'''
+    self.waiter.prepare('w', buffers[-1][0])
+    res = sum(self._i2c.write(Ddcci.ddc2i2c(buffer)) for buffer in buffers)
+    self._reader.new_search()
+    return res
+
   def read_nowait(self, op_hint):
-    '''Returns the next DDC/CI message payload. Operates with
+    '''Returns the next DDC/CI message payload as memoryview, which is only valid until
+    the next read (decode or copy it right away). Operates with
     read buffer from previous operations for possible pipelining and
     continuous reading from lower levels. How often low-level read()s is done
     and the amount read() at once is outlined below. Raises OSError() if no msg
@@ -590,71 +827,153 @@ class FakeWaiter:
     pass
 
 class Waiter:
+  '''Keeps the time between i2c reads and writes. A delay depends on the DDC/CI op of the last
+  write (the monitor might still process it) and the succession: 'wr' is write then read etc.
+  Entries are learned one by one and stored as `op succession seconds` lines: tune()d from
+  live traffic or get VCP 'wr' (r) and set VCP 'ww' (w) from TimingTest. Entries not
+  learned yet derive from r and w, but not below the settle times of the protocol notes.'''
+  r_entry, w_entry = (0x01, 'wr'), (0x03, 'ww')
+  settle_times = {0x01: 0, 0x03: 0, 0x07: .04, 0x0c: .2, 0xf3: .05}  # by op
+  # tune(): AIMD on the rate (1/delay) of an entry
+  tuning_run = 8  # successes in a row before speeding up
+  tuning_step = 1  # rate increase in 1/s
+  tuning_backoff = 1.5  # delay factor on failure
+  tuning_range = .005, .5  # seconds; below, a 'wr' entry goes to 0 (see tune())
+  tuning_save_interval = 60  # seconds between writing speedups to disk
+
   def __init__(self, open_config):
     self.open_config = open_config
     self.last_which = 'r'
+    self.last_op = None
     self.last_when = 0
-    default_delay = False
+    self.last_entry = None  # (op, succession) waited for by the last prepare()
+    self.learned = {}  # (op, succession) → seconds
+    self._runs = {}  # (op, succession) → successes in a row
+    self._fixed = False  # set_delay() active: no tuning
+    self._saved_at = 0
+    self._unsaved = False  # speedups tune() did not write yet
     with open_config() as file:
-      rw_delays = []
-      for _ in range(2):
-        try:
-          f = float(file.readline())
-        except ValueError:
-          f = .2
-          default_delay = True
-        rw_delays.append(f)
-    self._set_delay_permanently(*rw_delays)
-    self._default_delay = default_delay
+      lines = [line.split() for line in file if line.strip()]
+    try:
+      if lines and len(lines[0]) == 1:  # old format: r and w
+        self.learned = {Waiter.r_entry: float(lines[0][0]), Waiter.w_entry: float(lines[1][0])}
+      else:
+        self.learned = {(int(op, 16), succession): float(seconds) for op, succession, seconds in lines}
+    except (ValueError, IndexError):
+      log(29, 'sleep', 'Unreadable delays. Starting over.')
+      self.learned = {}
+    self._default_delay = not {Waiter.r_entry, Waiter.w_entry} <= self.learned.keys()
+    self._set_internal(self._base(), self.learned)
 
   def has_default_delay(self):
     return self._default_delay
 
+  def _base(self):
+    return tuple(self.learned.get(entry, .2) for entry in (Waiter.r_entry, Waiter.w_entry))
+
   def _write_config(self):
+    self._saved_at = time.time()
+    self._unsaved = False
     with self.open_config(mode='w') as file:
-      for float_val in self.delays_raw.values():
-        file.write(f'{float_val}\n')
+      for (op, succession), seconds in sorted(self.learned.items()):
+        file.write(f'{op:#04x} {succession} {seconds}\n')
+
+  def learn(self, op, succession, seconds, *, save=True):
+    '''Set a new delay for one entry.'''
+    self.learned[op, succession] = seconds
+    self._set_internal(self._base(), self.learned, level=19)
+    if save:
+      self._write_config()
+    else:
+      self._unsaved = True
+
+  def flush(self, *, after=0):
+    '''Write learned delays not saved yet (see tune()), if the last write was `after`
+    seconds ago at least.'''
+    if self._unsaved and time.time() - self._saved_at >= after:
+      self._write_config()
+
+  def tune(self, entry, ok):
+    '''Adjust `entry` after an exchange which relied on it went well (`ok`) or not (e.g. a
+    reply too early or a write which did not stick). Speedups are saved lazily. A 'wr' entry
+    which keeps working at the lower end of tuning_range is tried without any delay: the
+    request and its reply then go in one combined transfer (see Ddcci.write_nowait()).'''
+    if self._fixed or entry not in self.table or entry[0] is None or entry[1] == 'rr':
+      return
+    delay = self.table[entry]
+    if ok:
+      self._runs[entry] = self._runs.get(entry, 0) + 1
+      if self._runs[entry] < Waiter.tuning_run:
+        return
+      if entry[1] == 'wr' and delay <= Waiter.tuning_range[0]:
+        delay = 0.0
+      else:
+        delay = 1 / (1 / max(delay, Waiter.tuning_range[0]) + Waiter.tuning_step)
+    else:
+      delay = max(delay, Waiter.tuning_range[0]) * Waiter.tuning_backoff
+    self._runs[entry] = 0
+    if delay:
+      delay = min(Waiter.tuning_range[1], max(Waiter.tuning_range[0], delay))
+    log(19 if ok else 21, 'sleep', f'{"faster" if ok else "slower"}: {entry[0]:#04x} {entry[1]} {delay:.4}s')
+    self.learn(*entry, delay,
+      save=not ok or time.time() - self._saved_at > Waiter.tuning_save_interval)
 
   def remove_default_delays(self, rw_delays):
-      self._set_delay_permanently(*rw_delays)
+      self.learned[Waiter.r_entry], self.learned[Waiter.w_entry] = rw_delays
+      self._set_internal(rw_delays, self.learned)
       self._write_config()
       self._default_delay = False
 
-  def _set_delay_permanently(self, r, w):
-    self._set_internal(dict(r=r, w=w))
-
   @contextlib.contextmanager
-  def set_delay(self, *args, **kwargs):
-    saved_delays = self.delays_raw
-    self._set_delay_permanently(*args, **kwargs)
+  def set_delay(self, r, w):
+    '''Temporarily use delays derived from `r` and `w` only (i.e. ignoring learned entries).'''
+    saved = self.table, self._fixed
+    self._set_internal((r, w), {})
+    self._fixed = True
     try:
       yield
     finally:
-      self._set_internal(saved_delays)
+      self.table, self._fixed = saved
 
   def safe_delay(self):
     return self.set_delay(.2, .2)
 
-  def _set_internal(self, raw):
-    self.delays_raw = raw
-    self.delays = dict(wr=raw['r'], ww=raw['w'], rr=0)
-    self.delays['rw'] = max(*raw.values())
-    log(23, 'sleep', f'delays are r={raw["r"]:.5}, w={raw["w"]:.5}')
+  def _set_internal(self, rw_delays, learned, *, level=23):
+    r, w = rw_delays
+    derived = dict(wr=r, ww=w, rw=max(r, w), rr=0)
+    # settle times apply after writes: the monitor processes what it got
+    self.table = {(op, succession): learned.get((op, succession),
+        max(settle, delay) if succession[0] == 'w' else delay)
+      for op, settle in Waiter.settle_times.items() for succession, delay in derived.items()}
+    for succession in derived:  # unknown ops: the slowest known
+      self.table[None, succession] = max(self.table[op, succession] for op in Waiter.settle_times)
+    log(level, 'sleep', f'delays are r={r:.5}, w={w:.5}')
+
+  def delay(self, op, succession):
+    if (op, succession) not in self.table:
+      op = None
+    return self.table[op, succession]
+
+  def earliest(self, which):
+    '''Returns the time (as in time.time()) from which on `which` may be executed.'''
+    assert which in ('r', 'w')
+    return self.last_when + self.delay(self.last_op, self.last_which + which)
 
-  def prepare(self, which, op_hint=None):
+  def prepare(self, which, op=None):
     '''Either raise WouldBlockTime with corresponding timeout or update this Waiter
     to reflect execution of the corresponding operation. I.e. the prepared op should
-    be called immediately.'''
-    assert which in ('r', 'w')
+    be called immediately. Writes pass their DDC/CI `op` code.'''
     succession = self.last_which + which
-    extra_wait = .05 if op_hint == MccsOp.CAPABILITIES_REPLY else 0
-    wait_time = self.last_when + self.delays[succession] - time.time() + extra_wait
-    log(12, 'sleep', f'succession {succession}: {wait_time}s')
+    wait_time = self.earliest(which) - time.time()
+    log(12, 'sleep', f'succession {succession} after {self.last_op}: {wait_time}s')
     wait_time = max(0, wait_time)
     if wait_time:
       raise WouldBlockTime(wait_time)
+    self.last_entry = self.last_op, succession
     self.last_when = time.time()
     self.last_which = which
+    if which == 'w':
+      self.last_op = op
 
 
 def invalidate_read_preparation(method):
@@ -698,50 +1017,54 @@ class MccsOp(enum.Enum):
     obj._value_ = op_code
     obj.op_code = op_code
     obj.args = args
+    obj.is_flex = 0 in args
+    # op code and the fixed length args (a flexible one can only be last)
+    obj.struct = struct.Struct('>B' + ''.join({1: 'B', 2: 'H'}[length] for length in args if length))
     return obj
 
   # 4 → saddr, op, len, cksum
   ddc_min_len = property(lambda self: reduce(operator.add, self.args, 4))
-  is_flex = property(lambda self: 0 in self.args)
   # max len value 0x7f (including op byte) + 3 (source_addr, len, cksum)
   # allowed actually only 32x fragment + 6 (source_addr, len, opcode, 2x offset, (frag), chksum)
   ddc_max_len = property(lambda self: 38 if self.is_flex else self.ddc_min_len)
 
   def to_ddc(self, /, *args):
-    assert len(self.args) == len(args)
-    res = [self.op_code]
-    for arg, length in zip(args, self.args):
-      res.extend(arg.to_bytes(length, 'big'))
-    return res
+    '''Returns the payload as bytes.'''
+    return self.struct.pack(self.op_code, *args)
 
   @classmethod
   def from_ddc(cls, ba):
-    res = []
-    pos = 1
-    for length in cls(ba[0]).args:
-      if length != 0:
-        b = ba[pos:pos+length]
-        assert len(b) == length
-        res.append(int.from_bytes(b, 'big'))
-        pos += length
-      else:
-        res.append(ba[pos:])
-        break  # anything other than 0 in the end is not implemented (yet)
+    '''Returns the args of payload `ba`; a flexible one as slice of `ba` (i.e. without
+    copying if `ba` is a memoryview).'''
+    op = _mccs_ops[ba[0]]
+    _, *res = op.struct.unpack_from(ba)
+    if op.is_flex:
+      res.append(ba[op.struct.size:])
     return res
 
+_mccs_ops = {op.op_code: op for op in MccsOp}  # faster than MccsOp(op_code)
+
 
 class Mccs:
   _read_preparation_none = (None, None)
 
-  def __init__(self, *, file_name, open_config):
+  def __init__(self, *, file_name, open_config, i2c_dev=I2cDev):
     self.waiter = Waiter(open_config)
-    self._ddcci = Ddcci(file_name=file_name, waiter=self.waiter, resilient=True)
+    self._ddcci = Ddcci(file_name=file_name, waiter=self.waiter, resilient=True, i2c_dev=i2c_dev)
     self._read_preparation = Mccs._read_preparation_none
     self._capabilities = bytearray()  # half-read capas
     self.capabilities = None  # final capas (if read)
+    self._request_entry = None  # Waiter entry the prepared read’s request waited for
+    self._write_entries = {}  # vcp → Waiter entry its last write waited for (see verified())
 
-  async def optimize_delays(self):
-    if self._ddcci.waiter.has_default_delay():
+  def close(self):
+    self.waiter.flush()
+    self._ddcci.close()
+
+  async def optimize_delays(self, *, again=False):
+    '''Calibrate r and w with a TimingTest (takes long and flickers) if not known yet (or
+    `again`). For `d2see.py calibrate`; MonitorController’s Waiter tunes itself instead.'''
+    if again or self._ddcci.waiter.has_default_delay():
       rw_delays = await TimingTest(self).determine_delays()
       self._ddcci.waiter.remove_default_delays(rw_delays)
     else:
@@ -749,22 +1072,53 @@ class Mccs:
 
   @invalidate_read_preparation
   def write_nowait(self, vcpopcode, value):
-    return self._ddcci.write_nowait(MccsOp.WRITE.to_ddc(vcpopcode, value))
+    res = self._ddcci.write_nowait(MccsOp.WRITE.to_ddc(vcpopcode, value))
+    # with an earlier write unverified, a read can’t tell which one worked
+    self._write_entries[vcpopcode] = None if vcpopcode in self._write_entries else \
+      self.waiter.last_entry
+    return res
 
   write = variant(write_nowait, asynch=True)
 
+  @invalidate_read_preparation
+  def write_burst_nowait(self, writes):
+    '''Write several (vcpopcode, value) pairs in one burst, which is only safe for monitors
+    with the pipelined_writes quirk.'''
+    res = self._ddcci.write_burst_nowait([MccsOp.WRITE.to_ddc(*write) for write in writes])
+    for vcpopcode, _ in writes[1:]:  # only the first one waited
+      self._write_entries[vcpopcode] = None
+    vcpopcode = writes[0][0]
+    self._write_entries[vcpopcode] = None if vcpopcode in self._write_entries else \
+      self.waiter.last_entry
+    return res
+
+  def verified(self, vcpopcode, ok):
+    '''Tell if a read showed the last write to `vcpopcode` to be effective (for tuning).'''
+    self.waiter.tune(self._write_entries.pop(vcpopcode, None), ok)
+
   @invalidate_read_preparation
   def read_nowait(self, vcp_opcode):
     if self._read_preparation != (MccsOp.READ, vcp_opcode):
-      self._ddcci.write_nowait(MccsOp.READ.to_ddc(vcp_opcode))
+      self._ddcci.write_nowait(MccsOp.READ.to_ddc(vcp_opcode), MccsOp.READ_REPLY)
       self._read_preparation = (MccsOp.READ, vcp_opcode)
-    supported, reply_vcp, type_code, max_value, cur_value = MccsOp.from_ddc(
-      self._ddcci.read_nowait(MccsOp.READ_REPLY))
-    if supported != 0:
-      raise OSE(errno.ENOTSUP, 'VCP not supported', hex(vcp_opcode))
-    elif reply_vcp != vcp_opcode:
+      self._request_entry = self.waiter.last_entry
+    reply_entry = MccsOp.READ.op_code, 'wr'
+    glitches, null_msgs = self._ddcci.glitches, self._ddcci.null_msgs
+    try:
+      msg = self._ddcci.read_nowait(MccsOp.READ_REPLY)
+    except OSError:
+      # “not ready” from the monitor: read too early, otherwise the request got lost
+      self.waiter.tune(reply_entry if null_msgs != self._ddcci.null_msgs else self._request_entry, False)
+      raise
+    supported, reply_vcp, type_code, max_value, cur_value = MccsOp.from_ddc(msg)
+    if reply_vcp != vcp_opcode:  # our request got lost (or so)
+      self.waiter.tune(self._request_entry, False)
       raise OSE(errno.EL2NSYNC, 'Read result from a different request',
         hex(vcp_opcode), None, hex(reply_vcp))
+    self.waiter.tune(self._request_entry, True)
+    self.waiter.tune(reply_entry, glitches == self._ddcci.glitches)
+    if supported != 0:
+      raise OSE(errno.ENOTSUP, 'VCP not supported', hex(vcp_opcode))
     # VCP type code (0 == Set parameter, 1 = Momentary)?!?
     if type_code not in (0, 1) or vcp_opcode != Setting52.register and type_code:
       log(29, 'hw_comm', f'Found op with type_code = {type_code:#x} (op: {vcp_opcode:#x}).')
@@ -781,11 +1135,19 @@ class Mccs:
     while not self.capabilities:
       cap_len = len(self._capabilities)
       if self._read_preparation[0] != MccsOp.CAPABILITIES:
-        self._ddcci.write_nowait(MccsOp.CAPABILITIES.to_ddc(cap_len))
+        self._ddcci.write_nowait(MccsOp.CAPABILITIES.to_ddc(cap_len), MccsOp.CAPABILITIES_REPLY)
         self._read_preparation = (MccsOp.CAPABILITIES, cap_len)
-      offset, ba = MccsOp.from_ddc(self._ddcci.read_nowait(MccsOp.CAPABILITIES_REPLY))
+      reply_entry = MccsOp.CAPABILITIES.op_code, 'wr'
+      glitches = self._ddcci.glitches
+      try:
+        offset, ba = MccsOp.from_ddc(self._ddcci.read_nowait(MccsOp.CAPABILITIES_REPLY))
+      except OSError:
+        self.waiter.tune(reply_entry, False)
+        raise
+      self.waiter.tune(reply_entry, glitches == self._ddcci.glitches)
       self._read_preparation = self._read_preparation_none
-      assert offset <= cap_len
+      if offset > cap_len:
+        raise OSE(errno.EPROTO, 'Capability fragment beyond the ones received', offset)
       if offset == cap_len and not ba:  # EOS
         self.capabilities = self._capabilities
         break
@@ -794,13 +1156,9 @@ class Mccs:
       self._capabilities[offset:offset+len(ba)] = ba
     return self.capabilities
 
+  read_capabilities = variant(read_capabilities_nowait, asynch=True)
   read_capabilities_sync = variant(read_capabilities_nowait, sync=True)
 
-  @invalidate_read_preparation
-  def timing_nowait(self):
-    self._ddcci.write([0x07])
-    return self._ddcci.read(6)
-
   async def get_brightness_both(self):
     c, m, _ = (await self.read(0x10))
     return c, m
@@ -816,46 +1174,131 @@ class Mccs:
     return await self.write(0x10, value)
 
 
+class Capabilities:
+  '''Parsed MCCS capabilities string, e.g.
+  `(prot(monitor)type(lcd)cmds(01 02 03 0C E3 F3)vcp(10 12 14(05 08 0B) 60(01 03))mccs_ver(2.1))`.
+  `vcp` maps each supported VCP code to a tuple of allowed values or to None if the values
+  are not listed (e.g. continuous controls). It is None without a vcp field.'''
+  _field_start = re.compile(r'\s*([\w ]+?)\s*\(')
+
+  def __init__(self, raw):
+    self.raw = bytes(raw)
+    text = self.raw.decode('ascii', 'replace').strip().strip('\0')
+    if text.startswith('(') and text.endswith(')'):
+      text = text[1:-1]
+    self.fields = self._split_fields(text)
+    self.vcp = self._parse_vcp(self.fields['vcp']) if 'vcp' in self.fields else None
+    self.cmds = {int(h, 16) for h in re.findall('[0-9A-Fa-f]{2}', self.fields.get('cmds', ''))}
+    version = re.fullmatch(r'\s*(\d+)\.(\d+)\s*', self.fields.get('mccs_ver', ''))
+    self.mccs_version = tuple(map(int, version.groups())) if version else None
+    self.model = self.fields.get('model')
+    self.type = self.fields.get('type')
+
+  def supports(self, vcp):
+    return self.vcp is None or vcp in self.vcp
+
+  @staticmethod
+  def _split_fields(text):
+    '''Returns {name: content} for `name(content)` parts; content may contain parentheses.'''
+    fields = {}
+    pos = 0
+    while (match := Capabilities._field_start.match(text, pos)):
+      depth = 0
+      for end in range(match.end() - 1, len(text)):
+        depth += {'(': 1, ')': -1}.get(text[end], 0)
+        if depth == 0:
+          break
+      fields[match[1]] = text[match.end():end]
+      pos = end + 1
+    return fields
+
+  @staticmethod
+  def _parse_vcp(text):
+    vcp = {}
+    depth = 0
+    code = None
+    for token in re.findall(r'[0-9A-Fa-f]{2}|[()]', text):
+      if token == '(':
+        depth += 1
+        if depth == 1 and code is not None:
+          vcp[code] = ()
+      elif token == ')':
+        depth = max(0, depth - 1)
+      elif depth == 0:
+        code = int(token, 16)
+        vcp[code] = None
+      elif depth == 1 and code is not None:
+        vcp[code] += (int(token, 16),)
+    return vcp
+
+
+class ServiceClass(enum.Enum):
+  '''Kinds of pending work on a setting. Its deadline counts in seconds from the moment
+  the work became pending. The task loop serves the earliest deadline first.'''
+  INTERACTIVE = .1  # writing a value the user asked for, reading one someone waits for
+  VERIFICATION = 1  # rewriting and reading back what was written
+  BACKGROUND = 5  # initial reads, reread on 0x52 events, resetting 0x52
+
+  deadline = property(lambda self: self.value)
+
+def pend(setting, service):
+  '''Set `service` as the setting’s pending work (None for none) due from now on.'''
+  setting.service = service
+  setting.due = time.time() + service.deadline if service else float('inf')
+
+def back_off(task, max_doublings=6):
+  '''Push the deadline of `task`’s pending work back after a failed hw access: by its
+  deadline doubled per failure in a row. Work that keeps failing thus falls behind work
+  that becomes pending meanwhile instead of being picked again and again.'''
+  task.failed_in_row += 1
+  if task.service:
+    task.due = time.time() + \
+      task.service.deadline * 2 ** min(task.failed_in_row, max_doublings)
+
 class BaseSetting:
+  service = None  # ServiceClass of the pending work (if any)
+  due = float('inf')  # deadline of the pending work
+  failed_in_row = 0  # failed hw accesses since the last successful one
+
   def __init__(self, controller, register):
     self.controller = controller
     self.register = register
+    self.last_interaction = 0  # MonitorController._interactions at our last hw access
 
   def is_read_prepared(self):
     return self.controller._mccs._read_preparation == (MccsOp.READ, self.register)
 
-  def max_interaction_index(self):
-    return len(self.controller._settings)
-
   def interaction_index(self):
-    il = self.controller._interaction_log
-    if self.register in il:
-      return list(reversed(il)).index(self.register)
-    else:
-      return self.max_interaction_index()
+    # the less recently interacted, the higher (never: 0)
+    return -self.last_interaction
 
 class Setting2:
   register = 0x2
+  failed_in_row = 0
   # might change this into a w/o setting base...
   def __init__(self):
     self.new_value = None
     self.writings_left = 0
+    pend(self, None)
 
   def ack_write(self, *args):
     self.writings_left = 0
+    pend(self, None)
 
   def select_operation(self):
     assert self.writings_left
     return 'write', (self.new_value,), self.ack_write, None
 
-  def _write(self, value):
+  def _write(self, value, *, step=False):
     self.new_value = value
     self.writings_left = 1
+    if not self.service:
+      pend(self, ServiceClass.BACKGROUND)
     return True
 
   def priority(self):
     if self.writings_left:
-      return (Setting.writing_cycles+1, )
+      return (1, -self.due)
     else:
       return (-1, )
 
@@ -873,10 +1316,32 @@ class Setting52(BaseSetting):
 
   def select_operation(self):
     time_left = self.next_check - time.time()
-    if time_left <= 0:
-      return 'read', (), self.ack_read, self.nack_read
-    else:
+    if time_left > 0:
       return 'wait', time_left, None, None
+    supports52 = self.controller.supports52
+    if supports52.locked() and not supports52:
+      return 'wait', self._scan(), None, None
+    return 'read', (), self.ack_read, self.nack_read
+
+  def _scan(self):
+    '''Fallback without 0x52: reread the setting most overdue for it (see Setting.scan_due()).
+    Returns the time to wait for the next one. Spends at most scan_budget of the bus time.'''
+    controller = self.controller
+    now = time.time()
+    active = now - controller.last_activity < Setting.scan_activity
+    due, setting = min(((setting.scan_due(active), setting) for setting in controller._settings.values()
+      if isinstance(setting, Setting) and setting.confirmed and not setting.writings_left
+      and controller.supports(setting.register)), key=operator.itemgetter(0), default=(None, None))
+    if setting is None:
+      return Setting.scan_intervals[0]
+    elif due > now:
+      return due - now
+    setting.reread(scan=True)
+    controller._reprioritize(setting)
+    waiter = controller._mccs.waiter
+    read_time = waiter.delay(MccsOp.READ.op_code, 'wr') + waiter.delay(MccsOp.READ.op_code, 'rw')
+    self.next_check = now + read_time / controller.scan_budget
+    return 0
 
   def nack_read(self, exc):
     if exc.errno == errno.ENOTSUP:
@@ -886,8 +1351,7 @@ class Setting52(BaseSetting):
         if supports52:
           p, m = 25, 'monitor forgot that it support 0x52 “event polling”'
         else:
-          p, m = 27, 'Change-polling disabled or not supported.—Should scan settings instead...'
-          self.next_check = float('inf')
+          p, m = 27, 'Change-polling disabled or not supported. Scanning settings instead.'
       else:
         p, m = 19, '0x52 reported as unsupported'
       log(p, 'hw_comm', m)
@@ -899,12 +1363,17 @@ class Setting52(BaseSetting):
     if self.last_value not in (None, 0) and self.last_value != value:
       self.controller.needs_reset52.no()
     if value == 0:  # continue polling (no news)
-      self.next_check = time.time() + 1
+      now = time.time()
+      self.next_check = now + 1
+      for setting in self.controller._settings.values():  # known values are still valid
+        if isinstance(setting, Setting) and setting.fresh_at is not None:
+          setting.fresh_at = now
     else:
       setting = self.controller.setting(value)
       if setting:  # we work with this setting
         if setting.writings_left == 0:  # ...and we don’t change sth ourselves rn
           setting.reread(from52=True)  # trigger new read on different register
+          self.controller._reprioritize(setting)
       else:
         log(29, 'hw_comm', f'Setting52: Setting {value:#x} is not handled by me yet.')
         if self.last_value == value and not self.controller.needs_reset52.locked():
@@ -922,27 +1391,73 @@ class Setting52(BaseSetting):
     # (self.writings_left, not self.confirmed, self.is_read_prepared(), self.interaction_index())
     # less important than writing, less than unconfirmed reading, ...vcp...,
     #  ...but more than other confirmed!
-    # so I’m like reading, confirmed, is_read_prepared(), self.max_interaction_index()+1
-    return (0, not True, self.is_read_prepared(), self.max_interaction_index()+1)
+    # so I’m like idle, is_read_prepared(), above any interaction_index()
+    return (0, 0, self.is_read_prepared(), 1)
+
+class CapabilitiesTask:
+  '''Fetches the capabilities (if not cached on disk) in the task loop: fragment by
+  fragment whenever no setting has pending work, i.e. after first reads and writes but
+  before polling 0x52 and rereads.'''
+  register = None
+  service = None
+  due = float('inf')
+  failed_in_row = 0
+  max_failures = 3
+
+  def __init__(self, controller):
+    self.controller = controller
+    self.done = False
+    self.failures = 0
+
+  def priority(self):
+    return (-1, ) if self.done else (0, 1)
+
+  def select_operation(self):
+    return 'capabilities', (), self.ack, self.nack
+
+  def ack(self, raw):
+    self.done = True
+    if not self.controller.capabilities:  # e.g. fetched by snapshot() meanwhile
+      self.controller._store_capabilities(raw)
+
+  def nack(self, exc):
+    self.failures += 1
+    if self.failures >= CapabilitiesTask.max_failures:
+      log(29, 'hw_comm', f'{exc} on reading capabilities. Continuing without.')
+      self.done = True
+    else:
+      log(21, 'hw_comm', f'{exc} on reading capabilities. Trying again later.')
+    return True
 
 class Setting(BaseSetting):
   writing_cycles = 2  # how often we write to hw before checking
+  scan_intervals = 1, 60  # seconds between rereads without 0x52: after a change, at most
+  scan_activity = 30  # seconds after the user’s last write with scans at the shortest interval
 
-  def reread(self, *, from52=False):
+  def reread(self, *, from52=False, scan=False):
     '''Clear any write attempts and trigger read from hardware.
     Do remember old value for future reference, though.'''
     self.before_52_fresh = getattr(self, 'current_value', None) if from52 else None
-    self.current_value = None  # suspected or confirmed value in monitor
+    self.before_scan = getattr(self, 'current_value', None) if scan else None
+    if not scan:  # a scan just checks: no news that the value might have changed
+      self.fresh_at = None  # time current_value was known to be in hardware (None: not known)
+    self.current_value = self.before_scan  # suspected or confirmed value in monitor
     self.new_value = None  # value to be sent to monitor
     self.confirmed = False  # current_value is really in hardware
     self.writings_left = 0  # write several times, before even checking
+    self.is_step = False  # new_value is a transitional value: write once, don’t check
+    self.pipelined = None  # True: writes since last read were all in bursts, but never first
+    pend(self, ServiceClass.BACKGROUND)
 
   def __init__(self, controller, register):
     super().__init__(controller, register)
     self.reread()
     self.max = None  # maximum allowed value according to monitor
+    self.scan_interval = Setting.scan_intervals[0]  # grows while scans find no change
+    self.read_at = 0  # time of the last hw read
     self.listeners = set()  # callbacks for changes in current_value
     self.max_listeners = set()  # callbacks for max (called at most once)
+    self.read_listeners = set()  # callbacks for every hw read (changed value or not; None: ENOTSUP)
 
   def add_listeners(self, callback, max_callback=None):
     for (cb, value, listeners, one_time) in (
@@ -955,6 +1470,24 @@ class Setting(BaseSetting):
         if not one_time or value is None:
           listeners.add(cb)
 
+  def remove_listeners(self, callback, max_callback=None):
+    self.listeners.discard(callback)
+    self.max_listeners.discard(max_callback)
+
+  def age(self):
+    '''Seconds since current_value was known to be in hardware (None: not known).'''
+    return None if self.fresh_at is None else time.time() - self.fresh_at
+
+  def refresh(self):
+    '''Read again soon for someone waiting for a fresh value. Unlike reread(), it keeps
+    current_value meanwhile.'''
+    if self.writings_left:
+      return  # reading back follows anyway
+    self.new_value = None
+    self.confirmed = False
+    self.is_step = False
+    pend(self, ServiceClass.INTERACTIVE)
+
   def _set_current_value(self, new_value, /):
     # actually always called after hw read and hw write
     self.before_52_fresh = None
@@ -978,6 +1511,12 @@ class Setting(BaseSetting):
     Is either used on first initial hardware read for this setting or
     for the confirmation hardware read after several writes.'''
     value, max, *args = result
+    self.controller._mark_supported(self.register)
+    if self.new_value is not None:
+      self.controller._mccs.verified(self.register, value == self.new_value)
+    if self.pipelined:  # this read tells if the monitor accepts pipelined writes
+      pipelined_writes = ctx_quirks.get().pipelined_writes
+      pipelined_writes.yes() if value == self.new_value else pipelined_writes.no()
     if self.new_value is not None and self.new_value != value:  # writings did not succeed
       if self.new_value > max:  # ...and it probably never will succeed
         self.new_value = value
@@ -991,54 +1530,134 @@ class Setting(BaseSetting):
       # needs reset or it was manually set to same value
       self.controller.needs_reset52.yes()
       self.current_value = self.before_52_fresh
+    if self.before_scan is not None:
+      changed = value != self.before_scan
+      self.scan_interval = Setting.scan_intervals[0] if changed else \
+        min(Setting.scan_intervals[1], self.scan_interval * 2)
+      self.before_scan = None
+    self.read_at = time.time()
+    self.fresh_at = self.read_at
     self._set_max(max)
     self._set_current_value(value)
     self.confirmed = True
+    self.is_step = False
+    self.pipelined = None
+    pend(self, ServiceClass.VERIFICATION if self.writings_left else None)
+    for cb in list(self.read_listeners):
+      cb(value)
 
   def ack_write(self, *args):
     '''Update fields in case self.new_value is written to hardware.
     Part of the interface to hardware handling code.'''
     self._set_current_value(self.new_value)
     self.confirmed = False
+    self.fresh_at = None  # until read back
     self.writings_left = max(self.writings_left-1, 0)
+    self.pipelined = False
+    pend(self, None if self.is_step and not self.writings_left else ServiceClass.VERIFICATION)
+
+  def scan_due(self, active):
+    '''Time of the next reread when scanning for changes. With the user `active`, it
+    is due after the shortest interval.'''
+    return self.read_at + (Setting.scan_intervals[0] if active else self.scan_interval)
+
+  def nack_read(self, exc):
+    if exc.errno == errno.ENOTSUP:
+      self.controller._mark_unsupported(self.register)
+      if not self.controller.supports(self.register):
+        pend(self, None)
+      for cb in list(self.read_listeners):
+        cb(None)
+      return True
 
   def select_operation(self):
     if self.writings_left == 0:
-      return 'read', (), self.ack_read, None
+      return 'read', (), self.ack_read, self.nack_read
     else:
       return 'write', (self.new_value,), self.ack_write, None
 
-  def _write(self, value):
-    '''Set write wish in fields.
+  def _write(self, value, *, step=False):
+    '''Set write wish in fields. A `step` (of a transition) is written only once and
+    not checked. A step not yet written when the next wish comes in is dropped.
     Part of the interface to users of Setting.
     Returns boolean reflecting possible change in priorities (True).'''
-    if self.new_value == value:  # same write is already underway
+    if self.new_value == value and self.is_step == step:  # same write is already underway
       return False
     elif self.current_value == value:  # returning to value in monitor
       self.writings_left = 0
     else:
-      self.writings_left = Setting.writing_cycles
+      self.writings_left = 1 if step else Setting.writing_cycles
+      self.fresh_at = None  # about to change
     self.new_value = value
+    self.is_step = step
+    if self.writings_left:
+      if self.service is not ServiceClass.INTERACTIVE:  # else the user waits since then
+        pend(self, ServiceClass.INTERACTIVE)
+    elif self.confirmed:
+      pend(self, None)
+    elif not self.service:  # reading back is still to be done
+      pend(self, ServiceClass.VERIFICATION)
     return True
 
   def priority(self):
-    # 1. prefer writing
-    # 1.1. prefer “first” write instead of rewrites
-    # 2. reading
-    # 2.1. prefer reading values to be confirmed, not already confirmed
-    # 2.2. prefer reading which was prepared already (IMPORTANT; avoids back-and-forth w/ 2 tasks)
-    # 3. prefer least recently interacted register (might endless ping-pong reads without 2.2.)
-    return (self.writings_left, not self.confirmed, self.is_read_prepared(),
-      self.interaction_index())
+    # 1. prefer pending work (writing, rewriting, reading back, reading unconfirmed)
+    # 1.1. prefer earliest deadline (see ServiceClass; e.g. user’s writes before rereads)
+    # 2. prefer reading which was prepared already (IMPORTANT; avoids back-and-forth w/ 2 tasks)
+    # 3. prefer least recently interacted register (might endless ping-pong reads without 2.)
+    # (never for unsupported registers)
+    if not self.controller.supports(self.register):
+      return (-1, )
+    if self.writings_left or not (self.confirmed or self.is_step):
+      return (1, -self.due, self.is_read_prepared(), self.interaction_index())
+    return (0, 0, self.is_read_prepared(), self.interaction_index())
 
 class SettingsDict(dict):
   def __init__(self, controller):
     super().__init__()
     self._controller = controller
+  def __setitem__(self, key, setting):
+    super().__setitem__(key, setting)
+    self._controller._tasks.update(setting)
   def __missing__(self, key):
+    check_vcp(key)  # before its task could fail in the task loop
     self[key] = Setting(self._controller, key)
     return self[key]
 
+class _TaskEntry:
+  __slots__ = 'priority', 'order', 'task'
+  def __init__(self, priority, order, task):
+    self.priority = priority
+    self.order = order
+    self.task = task
+  def __lt__(self, other):  # heapq pops the smallest: make it the highest priority
+    return (self.priority, other.order) > (other.priority, self.order)
+
+class TaskQueue:
+  '''Tasks (i.e. settings) by priority(), the earlier added one first on a tie.
+  update() a task whenever its priority might have changed. Outdated heap entries are
+  skipped on top() and dropped for good when they pile up.'''
+  def __init__(self):
+    self._heap = []
+    self._entries = {}  # task → its current entry
+    self._orders = {}
+
+  def __len__(self):
+    return len(self._entries)
+
+  def update(self, task):
+    order = self._orders.setdefault(task, len(self._orders))
+    entry = self._entries[task] = _TaskEntry(task.priority(), order, task)
+    heapq.heappush(self._heap, entry)
+    if len(self._heap) > 2 * len(self._entries) + 16:
+      self._heap = list(self._entries.values())
+      heapq.heapify(self._heap)
+
+  def top(self):
+    heap = self._heap
+    while self._entries[heap[0].task] is not heap[0]:
+      heapq.heappop(heap)
+    return heap[0].task
+
 class Determination:
   '''Starts in a fluent state with a boolean value of `default`. Will reach locked state
   with yes()/no(). The state is represented by a value on a range from negated `no` over zero
@@ -1046,11 +1665,14 @@ class Determination:
   Each yes()/no() will put
   the state one `yes_step`/`no_step` within the range. When it reaches one of its ends, the
   boolean value is locked to False on its negative end and True on the positive one.
-  `yes` being 0 is the same as `yes=1` and `yes_step=float('inf')`. Works analogue with `no`.'''
+  `yes` being 0 is the same as `yes=1` and `yes_step=float('inf')`. Works analogue with `no`.
+  `on_change` is called with the Determination whenever it gets locked or unlocked.'''
   def __init__(self, name, *, yes, no, default, yes_step=1, no_step=1, log_category='hw_comm') -> None:
     self._name = name
     self._log_category = log_category
-    self._range = -no, yes
+    self._range = self._initial_range = -no, yes
+    self._restored = False
+    self.on_change = None
     self._default = default
     self._steps = -no_step, yes_step
     self._pos = 0
@@ -1063,56 +1685,425 @@ class Determination:
   def locked(self):
     return self._range == (0, 0)
 
+  def restore(self, value):
+    '''Lock to `value` learned earlier (e.g. in a previous run). Other than with a lock
+    reached through yes()/no(), a contradicting yes()/no() starts learning anew.'''
+    self._default = value
+    self._range = (0, 0)
+    self._restored = True
+
+  def forget(self):
+    '''Start learning anew (keeping the current value as default until locked).'''
+    log(24, self._log_category, f'{self._name}: learned long ago; learning again')
+    self._range = self._initial_range
+    self._pos = 0
+    self._restored = False
+    if self.on_change:
+      self.on_change(self)
+
   def _yesno(self, yesno):
-    if self.locked(): return
+    if self.locked():
+      if not self._restored or bool(yesno) == self._default: return
+      log(25, self._log_category, f'{self._name}: stored {bool(self)} contradicted; learning again')
+      self._range = self._initial_range
+      self._pos = 0
+      self._restored = False
+      if self.on_change:
+        self.on_change(self)
     self._pos = min(self._range[1], max(self._range[0], self._pos + self._steps[yesno]))
     if self._pos in self._range:
       self._default = False if self._pos == self._range[0] else True
       self._range = (0, 0)
       log(25, self._log_category, f'{self._name}: {bool(self)}')
+      if self.on_change:
+        self.on_change(self)
 
   no, yes = [lambda self, _i=i: self._yesno(_i) for i in range(2)]
 
   def __bool__(self):
     return self._default
 
+class QuirkStore:
+  '''Persists locked Determinations of a monitor and restores them in later runs, unless
+  learned more than `relearn_after` seconds ago: a locked value stops the observations
+  which could contradict it (e.g. supports52 False stops polling 0x52), so a firmware
+  update or a changed setting in the monitor’s menu would go unnoticed otherwise.'''
+  relearn_after = 7 * 24 * 3600
+  expiry_check_interval = 3600
+
+  def __init__(self, open_config):
+    self.open_config = open_config
+    self._tracked = []
+    self._checked_at = time.time()
+    with open_config() as file:
+      try:
+        self._stored = json.loads(file.read() or '{}')  # name → [value, time learned]
+      except ValueError:
+        log(29, 'hw_comm', 'Ignoring unreadable quirks file.')
+        self._stored = {}
+
+  def track(self, *determinations):
+    for determination in determinations:
+      determination.on_change = self._update
+      if determination._name in self._stored:
+        stored = self._stored[determination._name]
+        if isinstance(stored, list) and time.time() - stored[1] < QuirkStore.relearn_after:
+          determination.restore(stored[0])
+        else:  # or stored without time
+          determination.forget()
+    self._tracked.extend(determinations)
+    return self
+
+  def expire(self):
+    '''Let determinations locked for longer than `relearn_after` learn anew (e.g. in a
+    daemon running for weeks). Cheap to call often.'''
+    now = time.time()
+    if now - self._checked_at < QuirkStore.expiry_check_interval:
+      return
+    self._checked_at = now
+    for determination in self._tracked:
+      stored = self._stored.get(determination._name)
+      if determination.locked() and stored and now - stored[1] >= QuirkStore.relearn_after:
+        determination.forget()
+
+  def _update(self, determination):
+    if determination.locked():
+      self._stored[determination._name] = [bool(determination), time.time()]
+    else:
+      self._stored.pop(determination._name, None)
+    with self.open_config(mode='w') as file:
+      json.dump(self._stored, file, indent=1)
+
+def new_quirks():
+  '''Returns unlocked quirk determinations as expected in ctx_quirks.'''
+  return namespace(
+    chopped_reads=Determination('chopped_reads', default=True, yes=1, no=2),
+    pipelined_writes=Determination('pipelined_writes', default=False, yes=3, no=1),
+  )
+
 class MonitorController:
+  scan_budget = .05  # share of bus time for rereads when 0x52 can’t tell about changes
+
   def __init__(self, edid_device, nursery):
     self.edid_device = edid_device
     self.id = edid_device.edid_id
     self.open_config = partial(xdg.open_config, f'd2see/{self.id}')
-    self._mccs = Mccs(file_name=edid_device.file_name, open_config=self.open_config)
-    self.operations = dict(read=self._mccs.read_nowait, write=self._mccs.write_nowait)
+    self._mccs = Mccs(file_name=edid_device.file_name, open_config=self.open_config,
+      i2c_dev=edid_device.i2c_dev)
+    self.operations = dict(read=self._mccs.read_nowait, write=self._mccs.write_nowait,
+      capabilities=lambda _: self._mccs.read_capabilities_nowait())
+    self._tasks = TaskQueue()
+    self._interactions = 0  # hw accesses by settings so far
+    self._prepared = None  # register of prepared read as last seen by _reprioritize()
+    # per ServiceClass: work done, how often after its deadline and by how many seconds at most
+    self.deadline_stats = {service: namespace(served=0, missed=0, worst=0) for service in ServiceClass}
     self._settings = SettingsDict(self)
     self._settings[Setting52.register] = Setting52(self)
     self._settings[Setting2.register] = Setting2()
     self._prio_changed = trio.Event()  # or possibly changed
-    self._interaction_log = {}
+    self._bus_lock = trio.Lock()  # held while the task loop (or a group write) uses the bus
+    self._bus_limiter = trio.CapacityLimiter(1)  # worker thread doing this bus’s syscalls
+    self._in_flight = set()  # settings with hw access in a worker thread (see _deferring_wishes())
+    self._deferred = {}  # setting → (value, step) of write wishes while in flight
+    self._closing = False
+    self._device_closed = False
+    self._fades = {}  # register → cancel scope of running fade()
+    self.last_activity = 0  # time of the user’s last write (or fade)
+    self._open_capabilities = partial(xdg.open_config, f'd2see/capabilities/{edid_device.model_id}')
+    self.capabilities = None  # Capabilities (if known)
+    self._open_unsupported = partial(xdg.open_config,
+      f'd2see/capabilities/{edid_device.model_id}.unsupported')
+    self._supported = {}  # register → Determination from ENOTSUP and reads (see _support())
+    with self._open_unsupported() as file:
+      for line in file:
+        if line.strip():
+          self._support(int(line, 16)).restore(False)
     self.needs_reset52 = Determination('needs_reset52', yes=4, no=0, default=False)
     self.supports52 = Determination('supports52', yes=0, no=3, default=True)
+    self.quirks = new_quirks()
+    self._quirk_store = QuirkStore(partial(xdg.open_config, f'd2see/{self.id}.quirks')).track(
+      *vars(self.quirks).values(), self.needs_reset52, self.supports52)
+    self._cancel_scope = trio.CancelScope()
     if nursery:
-      nursery.start_soon(self._handle_tasks)
+      nursery.start_soon(self._run)
+
+  async def _run(self):
+    with self._cancel_scope:
+      await self._handle_tasks()
+
+  async def _run_io(self, func, *args, wait=False):
+    '''Returns func(*args), which blocks on i2c syscalls, from a worker thread of this bus:
+    a slow bus stalls neither the event loop (i.e. the UI) nor other monitors.
+    WouldBlockTime is raised or, with `wait`, waited for before calling again.'''
+    while True:
+      try:
+        return await trio.to_thread.run_sync(partial(func, *args), limiter=self._bus_limiter)
+      except WouldBlockTime as e:
+        if not wait:
+          raise
+        await trio.sleep(e.wait_time)
+      finally:
+        self._release_device()
+
+  @contextlib.contextmanager
+  def _deferring_wishes(self, *settings):
+    '''Keep write wishes for `settings` while their hw access and its ack are underway:
+    an ack has to refer to what was in place when the access started.'''
+    self._in_flight.update(settings)
+    try:
+      yield
+    finally:
+      self._in_flight.difference_update(settings)
+      for setting in settings:
+        if setting in self._deferred:
+          value, step = self._deferred.pop(setting)
+          self._wish(setting, value, step=step)
+
+  def _wish(self, setting, value, *, step=False):
+    if setting in self._in_flight:
+      self._deferred[setting] = value, step  # a newer wish replaces it (e.g. fade steps)
+    elif setting._write(value, step=step):
+      self._signal_prio_change(setting)
+
+  @contextlib.contextmanager
+  def _context(self):
+    '''Sets the context variables for hardware access outside of the task loop.'''
+    tokens = ctx_monitor.set(self.id), ctx_quirks.set(self.quirks)
+    try:
+      yield
+    finally:
+      for var, token in zip((ctx_monitor, ctx_quirks), tokens):
+        var.reset(token)
+
+  def _load_capabilities(self):
+    with self._open_capabilities() as file:
+      raw = file.read()
+    if raw:
+      self.capabilities = Capabilities(raw.encode('ascii', 'replace'))
+      self._forget_listed_unsupported()
+      self._reprioritize(*self._settings.values())
+    return self.capabilities
+
+  async def read_capabilities(self):
+    '''Returns the monitor’s Capabilities. They are fetched from hardware (which takes
+    seconds) only if not cached on disk for this monitor model yet.'''
+    if self.capabilities or self._load_capabilities():
+      return self.capabilities
+    async with self._bus_lock:
+      with self._context():
+        raw = await self._run_io(self._mccs.read_capabilities_nowait, wait=True)
+    self._store_capabilities(raw)
+    return self.capabilities
+
+  def _store_capabilities(self, raw):
+    self.capabilities = Capabilities(raw)
+    with self._open_capabilities(mode='w') as file:
+      file.write(self.capabilities.raw.decode('ascii', 'replace'))
+    log(26, 'hw_comm', f'Capabilities of {self.edid_device.model_id} are cached now.')
+    self._forget_listed_unsupported()
+    self._reprioritize(*self._settings.values())
+
+  async def snapshot(self, *, retries=1, recheck=False):
+    '''Read all supported VCP codes (0x00–0xdf without capabilities) but 0x52, whose reading
+    would consume change events. The bus lock is taken per code: the task loop keeps going.
+    Returns a dict with registers as {vcp: dict(value=, max=, type_code=)} and failed
+    reads as {vcp: error message}. Codes answered with “unsupported” are remembered;
+    with `recheck`, remembered ones are read again and dropped if answered now.'''
+    try:
+      await self.read_capabilities()
+    except OSError as e:
+      log(29, 'hw_comm', f'{e} on reading capabilities. Sweeping all codes.')
+    if self.capabilities and self.capabilities.vcp is not None:
+      codes = sorted(self.capabilities.vcp)
+    else:
+      codes = range(0xe0)
+    registers, failed = {}, {}
+    start = time.time()
+    for vcp in codes:
+      support = self._supported.get(vcp)
+      if vcp == Setting52.register:
+        continue
+      elif recheck and support is not None and not support:
+        support.restore(False)  # as if from disk: a successful read contradicts it
+      elif not self.supports(vcp):
+        continue
+      for attempt in range(retries + 1):
+        try:
+          value, max_value, type_code = await self.read(vcp)
+        except OSError as e:
+          if e.errno == errno.ENOTSUP:
+            break
+          failed[vcp] = str(e)
+        else:
+          registers[vcp] = dict(value=value, max=max_value, type_code=type_code)
+          failed.pop(vcp, None)
+          break
+    log(24, 'hw_comm', f'Snapshot of {len(registers)} VCP codes took {time.time() - start:.1f}s.')
+    return dict(id=self.id, model_id=self.edid_device.model_id, time=start,
+      registers=registers, failed=failed)
+
+  async def read(self, register):
+    '''Returns (value, max, type_code) of `register` read from hardware right away, i.e.
+    between two tasks of the task loop. Its answer counts for supports().'''
+    check_vcp(register)
+    with self._context():
+      try:
+        async with self._bus_lock:
+          result = await self._run_io(self._mccs.read_nowait, register, wait=True)
+      except OSError as e:
+        if e.errno == errno.ENOTSUP:
+          self._mark_unsupported(register)
+        raise
+      else:
+        self._mark_supported(register)
+        return result
+      finally:
+        self._reprioritize(*filter(None, [self.setting(register)]))
+
+  @staticmethod
+  async def snapshot_all(controllers, **kwargs):
+    '''Take snapshot()s of all `controllers` concurrently. Returns them by controller id.'''
+    snapshots = {}
+    async def take(mc):
+      snapshots[mc.id] = await mc.snapshot(**kwargs)
+    async with trio.open_nursery() as nursery:
+      for mc in controllers:
+        nursery.start_soon(take, mc)
+    return snapshots
+
+  def supports(self, register):
+    '''False if the register is known to be unsupported: not in the capabilities or
+    ENOTSUP seen repeatedly (for codes they list: in this run, otherwise also earlier on
+    this monitor model). 0x02 and 0x52 have their own determinations.'''
+    if register in (Setting2.register, Setting52.register):
+      return True
+    elif not self._listed(register, default=True):
+      return False
+    support = self._supported.get(register)
+    return support is None or bool(support)
+
+  def _listed(self, register, *, default):
+    '''Whether the capabilities list `register` (`default` if they don’t tell).'''
+    if self.capabilities is None or self.capabilities.vcp is None:
+      return default
+    return register in self.capabilities.vcp
+
+  def _support(self, register):
+    support = self._supported.get(register)
+    if support is None:
+      support = self._supported[register] = Determination(f'VCP {register:#x} support',
+        yes=0, no=3, default=True)
+      support.on_change = self._store_unsupported
+    return support
+
+  def _mark_unsupported(self, register):
+    '''Count an ENOTSUP for `register`.'''
+    self._support(register).no()
+
+  def _forget_listed_unsupported(self):
+    '''Drop codes found unsupported in earlier runs which the capabilities list.'''
+    listed = [register for register, support in self._supported.items()
+      if support._restored and self._listed(register, default=False)]
+    for register in listed:
+      del self._supported[register]
+    if listed:
+      self._store_unsupported(None)
+
+  def _mark_supported(self, register):
+    support = self._supported.get(register)
+    if support is not None:
+      support.yes()  # a restored “unsupported” is dropped, a learned one stays
+
+  def _store_unsupported(self, _):
+    '''Persist codes found unsupported but those the capabilities list: their ENOTSUP
+    might depend on the monitor’s state (e.g. the input).'''
+    with self._open_unsupported(mode='w') as file:
+      file.writelines(f'{reg:#04x}\n' for reg, support in sorted(self._supported.items())
+        if support.locked() and not support and not self._listed(reg, default=False))
+
+  def close(self):
+    '''Stop handling tasks for good and release the i2c device (as soon as no worker
+    thread uses it any more). Tuned delays not saved yet are written then.'''
+    self._cancel_scope.cancel()
+    self._closing = True
+    self._release_device()
+
+  def _release_device(self):
+    if self._closing and not self._bus_limiter.borrowed_tokens and not self._device_closed:
+      self._mccs.close()
+      self._device_closed = True
 
   def _interacted(self, setting):
-    self._interaction_log.pop(setting.register, None)
-    self._interaction_log[setting.register] = setting
+    self._interactions += 1
+    setting.last_interaction = self._interactions
+    self._reprioritize(setting)
+
+  def _served(self, setting, service, due):
+    '''Count the `service` work of `setting` (which was due at `due`) as done if the
+    setting moved on to other work since.'''
+    if not service or (setting.service, setting.due) == (service, due):
+      return
+    stats = self.deadline_stats[service]
+    stats.served += 1
+    lateness = time.time() - due
+    if lateness > 0:
+      stats.missed += 1
+      stats.worst = max(stats.worst, lateness)
+      log(21, 'sched', f'{service.name} work on {setting.register:#x} missed its deadline '
+        f'by {lateness * 1000:.0f}ms')
+
+  def _reprioritize(self, *settings):
+    '''Update `settings` in the task queue. Call it after changing them and after any
+    hw access: the settings whose read got (un)prepared are updated as well.'''
+    prepared = self._mccs._read_preparation
+    prepared = prepared[1] if prepared[0] == MccsOp.READ else None
+    if prepared != self._prepared:
+      settings += tuple(filter(None, map(self._settings.get, (self._prepared, prepared))))
+      self._prepared = prepared
+    for setting in settings:
+      self._tasks.update(setting)
 
   @staticmethod
-  def coldplug(nursery):
-    edid_datas = set()
-    mcs = []
-    for dev_name in glob.glob('/dev/i2c-*'):
+  async def probe(dev_name, nursery, *, timeout=2, edid_cache=None, i2c_dev=I2cDev):
+    '''Returns a MonitorController for the monitor on i2c bus `dev_name` or None.
+    The blocking EDID read runs in a worker thread and is abandoned after `timeout` seconds.
+    `i2c_dev` opens the bus (see EdidDevice).'''
+    with trio.move_on_after(timeout) as cancel_scope:
       try:
-        edid_device = EdidDevice(dev_name)
+        edid_device = await trio.to_thread.run_sync(
+          partial(EdidDevice, dev_name, edid_cache, i2c_dev=i2c_dev), abandon_on_cancel=True)
       except OSError:
-        continue
+        return None
+    if cancel_scope.cancelled_caught:
+      log(25, 'hw_enum', f'{dev_name} did not answer within {timeout}s. Skipping it.')
+      return None
+    return MonitorController(edid_device=edid_device, nursery=nursery)
+
+  @staticmethod
+  async def coldplug(nursery, found=None, *, timeout=2, dev_dir='/dev', i2c_dev=I2cDev):
+    '''Probe all i2c buses concurrently. Each MonitorController is handed to `found` (if
+    given) as soon as it exists. Returns all of them when the slowest bus is done.'''
+    edid_datas = set()
+    mcs = []
+    edid_cache = EdidCache(partial(xdg.open_config, 'd2see/edid_cache.json'))
+    async def probe_and_hand_over(dev_name):
+      mc = await MonitorController.probe(dev_name, nursery, timeout=timeout,
+        edid_cache=edid_cache, i2c_dev=i2c_dev)
+      if mc is None:
+        return
+      mcs.append(mc)
+      edid256 = mc.edid_device.edid256
+      if edid256 in edid_datas:
+        log(logging.WARNING, 'hw_enum', 'Monitors with the same EDID found. ' \
+              'This will probably mess things up.')
       else:
-        mcs.append(MonitorController(edid_device=edid_device, nursery=nursery))
-        if edid_device.edid256 in edid_datas:
-          log(logging.WARNING, 'hw_enum', 'Monitors with the same EDID found. ' \
-                'This will probably mess things up.')
-        else:
-          edid_datas.add(edid_device.edid256)
+        edid_datas.add(edid256)
+      if found:
+        found(mc)
+    async with trio.open_nursery() as probe_nursery:
+      for dev_name in glob.glob(os.path.join(dev_dir, 'i2c-*')):
+        probe_nursery.start_soon(probe_and_hand_over, dev_name)
+    edid_cache.save()
     return mcs
 
   async def _next_task(self, sleep):
@@ -1122,124 +2113,450 @@ class MonitorController:
     for new highest prio task.'''
     with trio.move_on_after(sleep):
       await self._prio_changed.wait()
-    return max(self._settings.values(), key=lambda item: item.priority())
+    self._quirk_store.expire()
+    self._mccs.waiter.flush(after=Waiter.tuning_save_interval)  # tuning may have stopped
+    return self._tasks.top()
 
   def setting(self, reg):
     return self._settings.get(reg, None)
 
   def add_listeners(self, register, *args, **kwargs):
-    return self._settings[register].add_listeners(*args, **kwargs)
+    return self._wanted(register).add_listeners(*args, **kwargs)
+
+  def remove_listeners(self, register, *args, **kwargs):
+    setting = self.setting(register)
+    if setting:
+      setting.remove_listeners(*args, **kwargs)
+
+  def _wanted(self, register):
+    '''The setting of `register`. A new one gets the task loop woken for its first read.'''
+    setting = self._settings.get(register)
+    if setting is None:
+      setting = self._settings[register]
+      self._signal_prio_change(setting)
+    return setting
+
+  async def get(self, register, max_age=None):
+    '''Returns (value, max) of `register` from memory whenever possible. With `max_age`, the
+    value was known to be in the monitor at most `max_age` seconds ago (or since the call):
+    read back then, or unchanged according to 0x52 (see Setting.age()). It is read (again)
+    otherwise. Without, any value known to the task loop will do, i.e. only a first read is
+    waited for. Raises ENOTSUP also if reading finds the register unsupported.'''
+    start = time.time()
+    setting = self._wanted(register) if self.supports(register) else None
+    def usable():
+      if not self.supports(register):
+        raise OSE(errno.ENOTSUP, 'VCP not supported', hex(register))
+      elif setting.current_value is None or setting.max is None:
+        return False
+      age = setting.age()
+      return max_age is None or age is not None and (age <= max_age or setting.fresh_at >= start)
+    while not usable():
+      setting.refresh()
+      self._signal_prio_change(setting)
+      known = trio.Event()
+      def on_known(_): known.set()
+      setting.listeners.add(on_known)
+      setting.read_listeners.add(on_known)
+      if setting.max is None:
+        setting.max_listeners.add(on_known)
+      try:
+        await known.wait()
+      finally:
+        setting.listeners.discard(on_known)
+        setting.read_listeners.discard(on_known)
+        setting.max_listeners.discard(on_known)
+    return setting.current_value, setting.max
+
+  def _signal_prio_change(self, setting):
+    self._reprioritize(setting)
+    self._prio_changed.set()
+    self._prio_changed = trio.Event()
 
   def write(self, register, value):
-    if self._settings[register]._write(value):
-      self._prio_changed.set()
-      self._prio_changed = trio.Event()
+    check_vcp(register, value)
+    self.last_activity = time.time()
+    self._cancel_fade(register)
+    if not self.supports(register):
+      log(29, 'hw_comm', f'Refusing write to unsupported VCP {register:#x}.')
+      return
+    self._wish(self._settings[register], value)
+
+  def _cancel_fade(self, register):
+    cancel_scope = self._fades.pop(register, None)
+    if cancel_scope:
+      cancel_scope.cancel()
+
+  async def fade(self, register, value, duration):
+    '''Change `register` gradually to `value` within `duration` seconds. Steps follow the
+    wall clock as often as the Waiter lets us write; steps the task loop could not write
+    in time are dropped. Ends with a regular write() of `value`. Raises ENOTSUP if the
+    first read finds the register unsupported.'''
+    check_vcp(register, value)
+    self.last_activity = time.time()
+    self._cancel_fade(register)
+    if not self.supports(register):
+      return self.write(register, value)  # refused
+    setting = self._wanted(register)
+    with trio.CancelScope() as cancel_scope:
+      self._fades[register] = cancel_scope
+      while setting.current_value is None and setting.new_value is None:  # wait for first read
+        if not self.supports(register):
+          raise OSE(errno.ENOTSUP, 'VCP not supported', hex(register))
+        known = trio.Event()
+        def on_known(_): known.set()
+        setting.listeners.add(on_known)
+        setting.read_listeners.add(on_known)  # also on ENOTSUP
+        try:
+          await known.wait()
+        finally:
+          setting.listeners.discard(on_known)
+          setting.read_listeners.discard(on_known)
+      from_value = setting.current_value if setting.new_value is None else setting.new_value
+      start = time.time()
+      now = start
+      while now < start + duration:
+        step_value = round(from_value + (value - from_value) * (now - start) / duration)
+        self._wish(setting, step_value, step=True)
+        waiter = self._mccs.waiter
+        pace = max(waiter.delay(MccsOp.WRITE.op_code, 'ww'), waiter.earliest('w') - now)
+        await trio.sleep(min(pace, start + duration - now))
+        now = time.time()
+      del self._fades[register]
+      self.write(register, value)
+
+  async def _write_now(self, register, value):
+    '''Like write(), but does the first hardware write right away instead of in the task
+    loop. Returns False if the monitor already has `value` or does not support `register`.
+    Raises WouldBlockTime.'''
+    if not self.supports(register):
+      return False
+    setting = self._settings[register]
+    self._wish(setting, value)
+    if not setting.writings_left:
+      return False
+    service, due = setting.service, setting.due
+    with self._deferring_wishes(setting), self._context():
+      setting.ack_write(await self._run_io(self.operations['write'], register, value))
+      self._served(setting, service, due)
+      self._interacted(setting)
+    return True
+
+  @staticmethod
+  async def write_synchronized(controllers, register, value):
+    '''Write `value` to `register` on all `controllers` at (nearly) the same moment: when
+    the last of them is allowed to by its Waiter. Their task loops are held meanwhile.
+    The writes run concurrently in the buses’ worker threads.
+    Returns the skew in seconds between the first and the last write to hardware.'''
+    check_vcp(register, value)
+    landed = []
+    for mc in controllers:  # as write() does
+      mc.last_activity = time.time()
+      mc._cancel_fade(register)
+    async with contextlib.AsyncExitStack() as stack:
+      for mc in sorted(controllers, key=lambda mc: mc.id):  # one order: no deadlock
+        await stack.enter_async_context(mc._bus_lock)
+      start = max((mc._mccs.waiter.earliest('w') for mc in controllers), default=0)
+      await trio.sleep(max(0, start - time.time()))
+      pending = list(controllers)
+      while pending:
+        wait_times = []
+        async def write_now(mc):
+          try:
+            wrote = await mc._write_now(register, value)
+          except WouldBlockTime as e:
+            wait_times.append(e.wait_time)
+            return
+          except OSError as e:
+            log(29, 'hw_comm', f'{mc.id}: {e} on synchronized write.')
+          else:
+            if wrote:
+              landed.append(time.time())
+          pending.remove(mc)
+        async with trio.open_nursery() as nursery:
+          for mc in pending:
+            nursery.start_soon(write_now, mc)
+        if wait_times:
+          await trio.sleep(min(wait_times))
+    skew = max(landed) - min(landed) if landed else 0
+    log(19, 'hw_comm', f'Synchronized write of {value} to {register:#x} on {len(landed)} '
+      f'monitors with {skew * 1000:.2f}ms skew.')
+    return skew
+
+  async def confirm_write(self, register, value):
+    '''Read `register` back after writing `value` without the task loop (e.g. by
+    write_synchronized() in `d2see.py set`) and write it again while it does not stick, at
+    most Setting.writing_cycles more times. Returns whether it sticks.'''
+    for cycle in range(Setting.writing_cycles + 1):
+      if cycle:
+        with self._context():
+          async with self._bus_lock:
+            await self._run_io(self._mccs.write_nowait, register, value, wait=True)
+      current, *_ = await self.read(register)
+      self._mccs.verified(register, current == value)
+      if current == value:
+        return True
+      log(21, 'hw_comm', f'Control read on {register:#x} was {current} instead of {value}.')
+    return False
+
+  def _burst_partners(self, task):
+    '''Returns other settings with pending writes to join `task`’s write, if the monitor
+    accepts (or might accept) pipelined writes.'''
+    pipelined_writes = ctx_quirks.get().pipelined_writes
+    if not isinstance(task, Setting) or not pipelined_writes and pipelined_writes.locked():
+      return []
+    return [setting for setting in self._settings.values()
+      if setting is not task and isinstance(setting, Setting) and setting.writings_left]
+
+  async def _write_burst(self, task, partners):
+    '''Writes `task` and its partners in one burst and acks the partners.'''
+    writes = [(setting.register, setting.new_value) for setting in (task, *partners)]
+    result = await self._run_io(self._mccs.write_burst_nowait, writes)
+    for setting in partners:
+      pipelined_only = setting.pipelined is not False
+      service, due = setting.service, setting.due
+      setting.ack_write(result)
+      setting.pipelined = pipelined_only
+      self._served(setting, service, due)
+      self._interacted(setting)
+    return result
 
   async def _handle_tasks(self):
-    quirks = namespace(chopped_reads=Determination('chopped_reads', default=True, yes=1, no=2))
     ctx_monitor.set(self.id)
-    ctx_quirks.set(quirks)
-    await self._mccs.optimize_delays()
+    ctx_quirks.set(self.quirks)
+    if not self.capabilities and not self._load_capabilities():
+      self._tasks.update(CapabilitiesTask(self))  # usable right away: fetched in between
+    self._reprioritize()
     sleep = 0
     while True:
       task = await self._next_task(sleep)
       sleep = 0
-      operation, op_args, ack_func, nack_func = task.select_operation()
-      if operation == 'wait':
-        sleep = op_args
-        continue
-      try:
-        result = self.operations[operation](task.register, *op_args)
-      except WouldBlockTime as e:
-        sleep = e.wait_time
-      except OSError as e:
-        if not (nack_func and nack_func(e)):
-          log(29, 'hw_comm', f'{e} on {operation} in handle_tasks().')
-      else:
-        ack_func(result)
-        self._interacted(task)
+      async with self._bus_lock:
+        operation, op_args, ack_func, nack_func = task.select_operation()
+        if operation == 'wait':
+          sleep = op_args
+          continue
+        service, due = task.service, task.due
+        partners = self._burst_partners(task) if operation == 'write' else []
+        with self._deferring_wishes(task, *partners):
+          try:
+            if partners:
+              result = await self._write_burst(task, partners)
+            else:
+              result = await self._run_io(self.operations[operation], task.register, *op_args)
+          except WouldBlockTime as e:
+            sleep = e.wait_time
+          except OSError as e:
+            if not (nack_func and nack_func(e)):
+              log(29, 'hw_comm', f'{e} on {operation} in handle_tasks().')
+            back_off(task)
+          else:
+            task.failed_in_row = 0
+            ack_func(result)
+            self._served(task, service, due)
+            self._interacted(task)
+            continue
+        self._reprioritize(task)
+
+
+class HotplugWatcher:
+  '''Keeps one MonitorController per monitor on the i2c buses in `dev_dir`. After the
+  coldplug, a bus is probed only when its device node appears (or changes permissions) and
+  its controller is torn down when the node vanishes. Other buses are left alone.
+  `i2c_dev` opens the buses (see EdidDevice), e.g. simulated ones in a fake `dev_dir`.'''
+  _mask = inotify.IN_CREATE | inotify.IN_DELETE | inotify.IN_ATTRIB | \
+    inotify.IN_MOVED_TO | inotify.IN_MOVED_FROM
+
+  def __init__(self, nursery, *, found=None, lost=None, timeout=2, dev_dir='/dev',
+      i2c_dev=I2cDev):
+    self._nursery = nursery
+    self._found = found
+    self._lost = lost
+    self._timeout = timeout
+    self.dev_dir = dev_dir
+    self._i2c_dev = i2c_dev
+    self.controllers = {}  # device file name → MonitorController
+    self._probing = set()
+
+  async def run(self, *, task_status=trio.TASK_STATUS_IGNORED):
+    '''Coldplug, pass the found controllers to task_status.started() and follow
+    hotplug events afterwards.'''
+    with inotify.Inotify(self.dev_dir, self._mask) as events:
+      mcs = await MonitorController.coldplug(self._nursery, self._add,
+        timeout=self._timeout, dev_dir=self.dev_dir, i2c_dev=self._i2c_dev)
+      task_status.started(mcs)
+      async with trio.open_nursery() as probe_nursery:
+        async for mask, name in events:
+          if not fnmatch.fnmatch(name, 'i2c-*'):
+            continue
+          dev_name = os.path.join(self.dev_dir, name)
+          if mask & (inotify.IN_DELETE | inotify.IN_MOVED_FROM):
+            self._remove(dev_name)
+          elif dev_name not in self.controllers and dev_name not in self._probing:
+            probe_nursery.start_soon(self._probe, dev_name)
+
+  async def _probe(self, dev_name):
+    self._probing.add(dev_name)
+    try:
+      mc = await MonitorController.probe(dev_name, self._nursery, timeout=self._timeout,
+        i2c_dev=self._i2c_dev)
+    finally:
+      self._probing.discard(dev_name)
+    if mc:
+      log(27, 'hw_enum', f'{mc.id} plugged in on {dev_name}')
+      self._add(mc)
+
+  def _add(self, mc):
+    self.controllers[mc.edid_device.file_name] = mc
+    if self._found:
+      self._found(mc)
+
+  def _remove(self, dev_name):
+    mc = self.controllers.pop(dev_name, None)
+    if mc:
+      log(27, 'hw_enum', f'{mc.id} on {dev_name} is gone')
+      mc.close()
+      if self._lost:
+        self._lost(mc)
+
+
+class Sprt:
+  '''Wald’s sequential probability ratio test: is a failure rate at most `p0` (pass) or at
+  least `p1` (fail)? `alpha` and `beta` bound the chances to fail a good and to pass a bad
+  rate. add() trial outcomes while `passed` is None. Undecided after `max_trials`: fail.'''
+  def __init__(self, p0, p1, *, alpha, beta, max_trials):
+    self._steps = math.log((1 - p1) / (1 - p0)), math.log(p1 / p0)  # by success, failure
+    self._bounds = math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+    self.max_trials = max_trials
+    self.llr = 0  # log likelihood ratio of fail over pass
+    self.trials = 0
+    self.failures = 0
+    self.passed = None
+
+  def add(self, ok):
+    self.trials += 1
+    self.failures += not ok
+    self.llr += self._steps[not ok]
+    if self.llr <= self._bounds[0]:
+      self.passed = True
+    elif self.llr >= self._bounds[1] or self.trials >= self.max_trials:
+      self.passed = False
+    return self.passed
+
+  def __bool__(self):
+    return bool(self.passed)
+
+
+def wilson_interval(failures, trials, z=1.96):
+  '''Confidence interval of a failure rate (95% with the default z).'''
+  if not trials:
+    return 0, 1
+  rate = failures / trials
+  center = (rate + z**2 / (2 * trials)) / (1 + z**2 / trials)
+  spread = z / (1 + z**2 / trials) * math.sqrt(rate * (1 - rate) / trials + z**2 / (4 * trials**2))
+  return max(0, center - spread), min(1, center + spread)
 
 
 class TimingTest:
+  '''Determines r and w by binary searches. Each probe of a delay is a sequential test
+  which stops as soon as the delay is clearly good or bad.'''
+  good_rate, bad_rate = .02, .2  # failure rates a probe passes / fails
+  alpha, beta = .1, .05  # chance to fail a good delay (slower result) / pass a bad one
+  max_trials = 60
+  margin = 1.2  # applied to the shortest delay which passed
+  search_range = .005, .2  # seconds
+
   def __init__(self, monitor):
     self.monitor = monitor
+    self.confidence = {}  # 'r'/'w' → namespace(bad, good, trials, failure_rate=(low, high))
 
-  async def safe_check(self):
+  async def safe_check(self, tries=3):
     m = self.monitor
     with m.waiter.safe_delay():
-      orig, mx = await m.get_brightness_both()
-      v = 1 if orig == 0 else orig - 1
-      await m.set_brightness(v)
-      assert await m.get_brightness() == v
-      await m.set_brightness(orig)
-      assert await m.get_brightness() == orig
-      return orig, mx
+      for i in range(tries):
+        try:
+          orig, mx = await m.get_brightness_both()
+          v = 1 if orig == 0 else orig - 1
+          await m.set_brightness(v)
+          assert await m.get_brightness() == v
+          await m.set_brightness(orig)
+          assert await m.get_brightness() == orig
+          return orig, mx
+        except OSError:
+          if i == tries - 1:
+            raise
 
-  def _tokens_repeat(self, failure_rate, tokens=1):
-    return tokens, round(tokens / failure_rate)
+  async def _read_trial(self, mx, r, w):
+    m = self.monitor
+    v = random.randint(0, mx)
+    with m.waiter.set_delay(r, w):
+      await m.set_brightness(v)
+      try:
+        return await m.get_brightness() == v
+      except OSError:
+        return False
 
-  async def _test_read(self, failure_rate, mx, r, w):
+  async def _write_trial(self, mx, r, w):
     m = self.monitor
-    tokens, repeat = self._tokens_repeat(failure_rate)
     with m.waiter.set_delay(r, w):
-      for i in range(repeat):
+      for j in range(random.randint(3, 8)):
         v = random.randint(0, mx)
         await m.set_brightness(v)
-        try:
-          if await m.get_brightness() != v:
-            if not tokens:
-              return False
-            else:
-              tokens -= 1
-        except OSError:
-          return False
-    return True
-
-  async def _test_write(self, failure_rate, mx, r, w):
-    m = self.monitor
-    tokens, repeat = self._tokens_repeat(failure_rate)
-    for i in range(repeat):
-      burst = random.randint(3, 8)
-      with m.waiter.set_delay(r, w):
-        for j in range(burst):
-          v = random.randint(0, mx)
-          await m.set_brightness(v)
-      with m.waiter.safe_delay():
-        if await m.get_brightness() != v:
-          if not tokens:
-            return False
-          else:
-            tokens -= 1
-    return True
+    with m.waiter.safe_delay():
+      try:
+        return await m.get_brightness() == v
+      except OSError:
+        return False
 
-  async def _test(self, what, failure_rate, r, w):
-    orig, mx = await self.safe_check()
+  async def _test(self, what, mx, r, w):
     m = self.monitor
+    with m.waiter.safe_delay():  # the last probe might have left the monitor busy
+      await trio.sleep(max(0, m.waiter.earliest('w') - time.time()))
     start = time.time()
-    testfunc = self._test_read if what == 'read' else self._test_write
-    result = await testfunc(failure_rate, mx, r, w)
-    r = "SUCC" if result else "FAIL"
-    log(22, 'test', f'{r} {what[0]} delay ({r}, {w}) took {time.time() - start} seconds')
-    return result
+    trial = self._read_trial if what == 'read' else self._write_trial
+    sprt = Sprt(self.good_rate, self.bad_rate, alpha=self.alpha, beta=self.beta,
+      max_trials=self.max_trials)
+    while sprt.passed is None:
+      sprt.add(await trial(mx, r, w))
+    log(22, 'test', f'{"SUCC" if sprt else "FAIL"} {what[0]} delay ({r:.4}, {w:.4}): '
+      f'{sprt.failures}/{sprt.trials} failed, took {time.time() - start:.2f} seconds')
+    return sprt
+
+  async def _search(self, name, test):
+    bad, good, sprt = await self.binary_search(*self.search_range, test)
+    trials = sprt.trials if sprt else 0
+    low, high = wilson_interval(sprt.failures, trials) if sprt else (0, 1)
+    self.confidence[name] = namespace(bad=bad, good=good, trials=trials, failure_rate=(low, high))
+    log(24, 'test', f'{name}: limit within [{bad:.4}, {good:.4}]s, failure rate at '
+      f'{good:.4}s within [{low:.1%}, {high:.1%}] (95%)')
+    return self.margin * good
 
   async def determine_delays(self):
-    r = 1.5 * await self.binary_search(0, .2, lambda r: self._test('read', .1, r, .2))
-    w = 1.5 * await self.binary_search(0, .2, lambda w: self._test('write', .1, r, w))
-    r = 1.2 * await self.binary_search(0, r, lambda r: self._test('read', .1, r, w))
-    w = 1.2 * await self.binary_search(0, w, lambda w: self._test('write', .1, r, w))
-    # assert await self._test('write', .1, r, w)
-    # assert await self._test('read', .1, r, w)
+    '''Returns (r, w). Writes do not depend on r: w first, then r with it. An r of 0 (replies
+    ready right away, see Ddcci.write_nowait()) is probed before searching. The brightness
+    is set back at the end.'''
+    orig, mx = await self.safe_check()
+    try:
+      w = await self._search('w', lambda w: self._test('write', mx, .2, w))
+      if await self._test('read', mx, 0.0, w):
+        r = 0.0
+      else:
+        r = await self._search('r', lambda r: self._test('read', mx, r, w))
+    finally:
+      with self.monitor.waiter.safe_delay(), trio.CancelScope(shield=True):
+        await self.monitor.set_brightness(orig)
     return (r, w)
 
   @staticmethod
   async def binary_search(a, b, function):
-    good = b
-    bad = a
+    '''Returns (bad, good, result at good). `b` is assumed good without a result. Bisects
+    geometrically: delays matter relative to each other (and small ones test faster).'''
+    good, bad, good_result = b, a, None
     for i in range(5):
-      test_point = bad + (good - bad) / 2
+      test_point = math.sqrt(bad * good)
       result = await function(test_point)
       if result:
-        good = test_point
+        good, good_result = test_point, result
       else:
         bad = test_point
-    return good
\ No newline at end of file
+    return bad, good, good_result
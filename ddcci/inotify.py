@@ -0,0 +1,55 @@
+import ctypes
+import os
+import struct
+
+import trio
+
+IN_ATTRIB = 0x4
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+
+_event = struct.Struct('iIII')  # wd, mask, cookie, len (of the following name)
+_libc = ctypes.CDLL(None, use_errno=True)
+
+class Inotify:
+  '''Watches a single directory. Async iteration yields (mask, name) per event.'''
+  def __init__(self, path, mask):
+    self._fd = _libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    if self._fd < 0:
+      raise OSError(ctypes.get_errno(), 'inotify_init1() failed')
+    if _libc.inotify_add_watch(self._fd, os.fsencode(path), mask) < 0:
+      err = ctypes.get_errno()
+      os.close(self._fd)
+      raise OSError(err, 'inotify_add_watch() failed', path)
+    self._pending = []
+
+  def close(self):
+    trio.lowlevel.notify_closing(self._fd)
+    os.close(self._fd)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+  def __aiter__(self):
+    return self
+
+  async def __anext__(self):
+    while not self._pending:
+      await trio.lowlevel.wait_readable(self._fd)
+      try:
+        buffer = os.read(self._fd, 4096)
+      except BlockingIOError:
+        continue
+      pos = 0
+      while pos < len(buffer):
+        _, mask, _, length = _event.unpack_from(buffer, pos)
+        pos += _event.size
+        name = buffer[pos:pos+length].rstrip(b'\0')
+        pos += length
+        self._pending.append((mask, os.fsdecode(name)))
+    return self._pending.pop(0)
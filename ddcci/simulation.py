@@ -0,0 +1,213 @@
+import errno
+import operator
+import random
+import time
+from functools import reduce
+from types import SimpleNamespace as namespace
+
+from ddcci.ddcci import OSE
+
+null_msg = bytes.fromhex('6e 80 be')
+padding = 0xff  # what a read beyond the available reply returns
+
+
+class SimulatedI2cDev:
+  '''Stands in for I2cDev. Obtained through SimulatedMonitor.i2c_dev().'''
+  def __init__(self, monitor, i2c_slave_addr):
+    if i2c_slave_addr not in (0x37, 0x50):
+      raise OSE(errno.ENXIO, 'No simulated device at address', hex(i2c_slave_addr))
+    self._monitor = monitor
+    self._addr = i2c_slave_addr
+    self.combined = monitor.combined_transfers
+
+  def read(self, length):
+    stats = self._monitor.stats
+    stats.reads += 1
+    stats.read_bytes += length
+    return self._read(length)
+
+  def write(self, buffer):
+    stats = self._monitor.stats
+    stats.writes += 1
+    stats.written_bytes += len(buffer)
+    return self._write(buffer)
+
+  def transfer(self, buffer, read_buffer):
+    '''Like I2cDev.transfer(): write and read as one (combined) transfer if `combined`.'''
+    if not self.combined:
+      self.write(buffer)
+      data = self.read(len(read_buffer))
+    else:
+      stats = self._monitor.stats
+      stats.transfers += 1
+      stats.written_bytes += len(buffer)
+      stats.read_bytes += len(read_buffer)
+      self._write(buffer)
+      data = self._read(len(read_buffer))
+    read_buffer[:len(data)] = data
+    return len(data)
+
+  def _read(self, length):
+    if self._addr == 0x50:
+      return self._monitor._edid_read(length)
+    return self._monitor._ddc_read(length)
+
+  def _write(self, buffer):
+    if self._addr == 0x50:
+      self._monitor._edid_pos = buffer[0]
+    else:
+      self._monitor._ddc_write(bytes(buffer))
+    return len(buffer)
+
+  def close(self):
+    pass
+
+
+class SimulatedMonitor:
+  '''A DDC/CI monitor in memory, e.g. for EdidDevice('sim-1', i2c_dev=monitor.i2c_dev).
+
+  * read_delay: time after a request until its reply can be read (earlier: null msg)
+  * write_delay: time after any write during which further writes are dropped
+  * chopped_reads: consecutive reads continue the reply instead of restarting it
+  * pipelined_writes: set VCP msgs are accepted even during write_delay
+  * combined_transfers: the adapter does I2C_RDWR (write and read in one transfer)
+  * null_msg_rate: share of replies preceded by a null msg
+  * noise_rate: share of replies with a flipped bit (i.e. checksum mismatch)
+  * change_polling: support level 'a' to 'e' for 0x02/0x52 as described in
+    documentation/mccs_value_polling.txt; OSD changes are simulated with osd_set()
+  * registers: {vcp_code: (value, max)} for the (other) supported VCP codes
+  '''
+  default_registers = {0x10: (50, 100), 0x12: (75, 100), 0x14: (5, 11), 0x60: (15, 18)}
+
+  def __init__(self, *, serial=1, read_delay=.04, write_delay=.05, chopped_reads=True,
+      pipelined_writes=False, combined_transfers=True, null_msg_rate=0, noise_rate=0,
+      change_polling='c', registers=None, capabilities=None, seed=0, clock=time.time):
+    assert change_polling in 'abcde'
+    self.read_delay = read_delay
+    self.write_delay = write_delay
+    self.chopped_reads = chopped_reads
+    self.pipelined_writes = pipelined_writes
+    self.combined_transfers = combined_transfers
+    self.null_msg_rate = null_msg_rate
+    self.noise_rate = noise_rate
+    self.change_polling = change_polling
+    self.registers = {vcp: list(vm) for vcp, vm in (registers or self.default_registers).items()}
+    self._random = random.Random(seed)
+    self._clock = clock
+    self.edid256 = self._make_edid(serial)
+    self._edid_pos = self._random.randrange(256)  # current position unknown to the host
+    if capabilities is None:
+      vcps = sorted({*self.registers, *self._change_registers()})
+      capabilities = (f'(prot(monitor)type(lcd)model(SIM{serial})cmds(01 02 03 0C E3 F3)'
+        f'vcp({" ".join(f"{vcp:02X}" for vcp in vcps)})mccs_ver(2.2))')
+    self.capabilities = capabilities.encode()
+    self._events = []  # changed registers (only the last one is kept for c)
+    self._busy_until = 0
+    self._reply = None
+    self._reply_pos = 0
+    self._reply_ready = 0
+    self.stats = namespace(reads=0, writes=0, transfers=0, read_bytes=0, written_bytes=0,
+      dropped_writes=0, early_reads=0)
+
+  def i2c_dev(self, file_name, i2c_slave_addr, *, resilient=False):
+    return SimulatedI2cDev(self, i2c_slave_addr)
+
+  def osd_set(self, vcp, value):
+    '''Change a value like a user pressing the monitor’s buttons would.'''
+    self.registers[vcp][0] = value
+    if self.change_polling == 'c':
+      self._events[:] = [vcp]
+    elif self.change_polling != 'a':
+      self._events.append(vcp)
+
+  def _change_registers(self):
+    return {'a': (), 'b': (0x02,)}.get(self.change_polling, (0x02, 0x52))
+
+  @staticmethod
+  def _make_edid(serial):
+    edid = bytearray(128)
+    edid[0:8] = bytes.fromhex('00 FF FF FF FF FF FF 00')
+    manu_code = 0
+    for letter in 'SIM':
+      manu_code = manu_code << 5 | ord(letter) - ord('A') + 1
+    edid[8:10] = manu_code.to_bytes(2, 'big')
+    edid[10:12] = (0xd2c).to_bytes(2, 'little')  # product code
+    edid[12:16] = serial.to_bytes(4, 'little')
+    edid[16:20] = bytes([1, 30, 1, 4])  # week, year - 1990, EDID version 1.4
+    edid[127] = -sum(edid) % 256
+    return bytes(edid) * 2  # 128 byte EEPROMs wrap around
+
+  def _edid_read(self, length):
+    res = bytes(self.edid256[(self._edid_pos + i) % 256] for i in range(length))
+    self._edid_pos = (self._edid_pos + length) % 256
+    return res
+
+  def _ddc_write(self, buffer):
+    now = self._clock()
+    valid = not (len(buffer) < 4 or buffer[0] != 0x51 or not buffer[1] & 0x80
+        or len(buffer) != (buffer[1] & 0x7f) + 3 or reduce(operator.xor, buffer, 0x6e))
+    op, *args = buffer[2:-1] if valid else [None]
+    if now < self._busy_until and not (self.pipelined_writes and op == 0x03):
+      self.stats.dropped_writes += 1
+      return
+    self._busy_until = now + self.write_delay
+    if not valid:
+      return  # not a DDC/CI msg for us
+    reply = None
+    if op == 0x01 and len(args) == 1:
+      reply = self._vcp_reply(args[0])
+    elif op == 0x03 and len(args) == 3:
+      self._set_vcp(args[0], int.from_bytes(args[1:], 'big'))
+    elif op == 0xf3 and len(args) == 2:
+      offset = int.from_bytes(args, 'big')
+      reply = bytes([0xe3, *args]) + self.capabilities[offset:offset+32]
+    if reply:
+      self._set_reply(reply)
+
+  def _vcp_reply(self, vcp):
+    if vcp == 0x02 and vcp in self._change_registers():
+      value_max = (2 if self._events else 1), 2
+    elif vcp == 0x52 and vcp in self._change_registers():
+      value_max = (self._events[0] if self._events else 0), 0xff
+      if self.change_polling == 'e':
+        self._events[:1] = []
+    elif vcp in self.registers:
+      value_max = self.registers[vcp]
+    else:
+      return bytes([0x02, 0x01, vcp, 0, 0, 0, 0, 0])
+    value, max_value = value_max
+    type_code = 1 if vcp == 0x52 else 0
+    return bytes([0x02, 0x00, vcp, type_code, *max_value.to_bytes(2, 'big'),
+      *value.to_bytes(2, 'big')])
+
+  def _set_vcp(self, vcp, value):
+    if vcp == 0x02 and value == 1 and vcp in self._change_registers():  # reset
+      if self.change_polling == 'd':
+        self._events[:1] = []
+      else:
+        self._events.clear()
+    elif vcp in self.registers:
+      self.registers[vcp][0] = min(value, self.registers[vcp][1])
+
+  def _set_reply(self, payload):
+    msg = bytearray([0x6e, len(payload) | 0x80, *payload])
+    msg.append(reduce(operator.xor, msg, 0x50))
+    if self._random.random() < self.noise_rate:
+      msg[self._random.randrange(len(msg))] ^= 1 << self._random.randrange(8)
+    if self._random.random() < self.null_msg_rate:
+      msg[0:0] = null_msg
+    self._reply = bytes(msg)
+    self._reply_pos = 0
+    self._reply_ready = self._clock() + self.read_delay
+
+  def _ddc_read(self, length):
+    if self._reply is None or self._clock() < self._reply_ready:
+      if self._reply is not None:
+        self.stats.early_reads += 1
+      res = null_msg[:length]
+    else:
+      if not self.chopped_reads:
+        self._reply_pos = 0
+      res = self._reply[self._reply_pos:self._reply_pos+length]
+      self._reply_pos += len(res)
+    return res + bytes([padding]) * (length - len(res))
@@ -25,4 +25,9 @@ def open_config(relpath, mode='r'):
       continue
     else:
       return f
-  return open(os.devnull, mode)
\ No newline at end of file
+  return open(os.devnull, mode)
+
+def runtime_path(relpath):
+  '''Path of `relpath` in the user’s runtime dir, e.g. for sockets.'''
+  d, = base_dirs('XDG_RUNTIME_DIR', split=False, default=f'/run/user/{os.getuid()}')
+  return os.path.join(d, relpath)
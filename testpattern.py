@@ -114,10 +114,13 @@ class MonitorScale(Gtk.HBox):
         scale.connect('value-changed',
                 lambda scale: mc.write(register, round(scale.get_value()))
             )
-        mc.add_listeners(register,
+        listeners = (
                 lambda val: scale.set_value(val),
                 lambda max: scale.set_range(0, max),
             )
+        mc.add_listeners(register, *listeners)
+        # the controller outlives us if the windows are rebuilt (see d2see.py)
+        self.connect('destroy', lambda _: mc.remove_listeners(register, *listeners))
         self.pack_start(scale, False, False, 0)
         self.pack_start(label, False, False, 0)
 
@@ -0,0 +1,84 @@
+from types import SimpleNamespace as namespace
+
+import pytest
+
+from ddcci import ddcci
+
+
+class StreamDev:
+  '''Stands in for I2cDev: each read continues where the last one stopped (padded with
+  0xff), i.e. the monitor allows chopped reads.'''
+  def __init__(self, stream):
+    self.stream = stream
+    self.pos = 0
+
+  def readinto(self, buffer):
+    res = self.stream[self.pos:self.pos+len(buffer)]
+    buffer[:] = res + b'\xff' * (len(buffer) - len(res))
+    self.pos += len(buffer)
+    return len(buffer)
+
+
+@pytest.fixture
+def quirks():
+  quirks = ddcci.new_quirks()
+  token = ddcci.ctx_quirks.set(quirks)
+  yield quirks
+  ddcci.ctx_quirks.reset(token)
+
+def reader_for(stream):
+  return ddcci.DdcciMsgReader(namespace(resilient=True, waiter=ddcci.FakeWaiter(),
+    _i2c=StreamDev(stream)))
+
+def reply_frame(payload):
+  frame = bytearray([0x6e, len(payload) | 0x80, *payload])
+  frame.append(0x50)
+  for byte in frame[:-1]:
+    frame[-1] ^= byte
+  return bytes(frame)
+
+READ_REPLY = ddcci.MccsOp.READ_REPLY.to_ddc(0, 0x10, 0, 100, 42)
+NULL_MSG = bytes.fromhex('6e 80 be')
+
+
+def test_request_framing():
+  assert ddcci.Ddcci.ddc2i2c(ddcci.MccsOp.READ.to_ddc(0x10)) == bytes.fromhex('51 82 01 10 ac')
+  assert ddcci.Ddcci.ddc2i2c(ddcci.MccsOp.WRITE.to_ddc(0x10, 50)) == \
+    bytes.fromhex('51 84 03 10 00 32 9a')
+
+def test_codec_round_trip():
+  assert ddcci.MccsOp.from_ddc(READ_REPLY) == [0, 0x10, 0, 100, 42]
+  assert ddcci.MccsOp.from_ddc(ddcci.MccsOp.WRITE.to_ddc(0x12, 0x1234)) == [0x12, 0x1234]
+  payload = memoryview(ddcci.MccsOp.CAPABILITIES_REPLY.to_ddc(32) + b'(vcp(10))')
+  offset, fragment = ddcci.MccsOp.from_ddc(payload)
+  assert (offset, bytes(fragment)) == (32, b'(vcp(10))')
+
+def test_reader_skips_null_msgs_and_padding(quirks):
+  reader = reader_for(b'\xff' * 3 + NULL_MSG + reply_frame(READ_REPLY))
+  assert bytes(reader.find_next_limited(ddcci.MccsOp.READ_REPLY)) == READ_REPLY
+  assert (reader.null_msgs, reader.glitches) == (1, 1)
+
+def test_reader_drops_bad_checksums(quirks):
+  bad = bytearray(reply_frame(READ_REPLY))
+  bad[-1] ^= 1
+  reader = reader_for(bytes(bad) + reply_frame(READ_REPLY))
+  assert bytes(reader.find_next_limited(ddcci.MccsOp.READ_REPLY)) == READ_REPLY
+  assert (reader.null_msgs, reader.glitches) == (0, 1)
+
+def test_reader_overlapping_candidates(quirks):
+  # a source address inside a bad frame starts the next candidate: its checksum reuses
+  # the running XORs of the bytes before
+  garbage = bytes([0x6e, 0x84, 0x6e, 0x80])
+  reader = reader_for(garbage + reply_frame(READ_REPLY))
+  assert bytes(reader.find_next_limited(None)) == READ_REPLY
+
+def test_reader_completes_chopped_reads(quirks):
+  # the reply starts late in the first read and is completed by a second, shorter one
+  reader = reader_for(b'\x00' * 5 + reply_frame(READ_REPLY))
+  assert bytes(reader.find_next_limited(ddcci.MccsOp.READ_REPLY)) == READ_REPLY
+  assert quirks.chopped_reads.locked() and quirks.chopped_reads
+
+def test_reader_gives_up_without_msg(quirks):
+  reader = reader_for(b'\x00' * 64)
+  with pytest.raises(OSError):
+    reader.find_next_limited(ddcci.MccsOp.READ_REPLY)
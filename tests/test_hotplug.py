@@ -0,0 +1,51 @@
+import errno
+import os
+
+import trio
+
+from ddcci import ddcci
+from ddcci.simulation import SimulatedMonitor
+
+
+def test_hotplug_in_fake_dev_dir(tmp_path, monkeypatch):
+  monkeypatch.setenv('XDG_CONFIG_HOME', str(tmp_path / 'config'))
+  dev_dir = tmp_path / 'dev'
+  dev_dir.mkdir()
+  sims = {'i2c-1': SimulatedMonitor(serial=1), 'i2c-2': SimulatedMonitor(serial=2)}
+
+  def i2c_dev(file_name, i2c_slave_addr, *, resilient=False):
+    sim = sims.get(os.path.basename(file_name))
+    if sim is None:  # e.g. a bus without a monitor
+      raise ddcci.OSE(errno.ENXIO, 'No device at address', hex(i2c_slave_addr))
+    return sim.i2c_dev(file_name, i2c_slave_addr, resilient=resilient)
+
+  found, lost = [], []
+
+  async def wait_for(condition):
+    with trio.fail_after(5):
+      while not condition():
+        await trio.sleep(.01)
+
+  async def main():
+    (dev_dir / 'i2c-1').touch()
+    async with trio.open_nursery() as nursery:
+      watcher = ddcci.HotplugWatcher(nursery, found=found.append, lost=lost.append,
+        dev_dir=str(dev_dir), i2c_dev=i2c_dev)
+      mcs = await nursery.start(watcher.run)
+      assert [mc.edid_device.file_name for mc in mcs] == [str(dev_dir / 'i2c-1')]
+
+      (dev_dir / 'i2c-3').touch()  # no monitor
+      (dev_dir / 'i2c-2').touch()
+      await wait_for(lambda: len(found) == 2)
+      assert found[1].id == ddcci.EdidDevice('sim', i2c_dev=sims['i2c-2'].i2c_dev).edid_id
+      assert sorted(watcher.controllers) == [str(dev_dir / 'i2c-1'), str(dev_dir / 'i2c-2')]
+
+      (dev_dir / 'i2c-2').unlink()
+      await wait_for(lambda: lost)
+      assert lost == [found[1]]
+      assert list(watcher.controllers) == [str(dev_dir / 'i2c-1')]
+      nursery.cancel_scope.cancel()
+    for mc in found:
+      mc.close()
+
+  trio.run(main)